@@ -0,0 +1,56 @@
+import random
+import sys
+import timeit
+
+from phrases import PhraseMatcher, load_phrases
+
+# Replies are mostly ordinary words, some of them contain a phrase.
+words = "great work thanks for this it is so helpful nice image text the a".split()
+
+
+def count_separately(texts, phrases):
+    """How replies were counted before PhraseMatcher, one scan per phrase."""
+    counts = dict.fromkeys(phrases, 0)
+    for text in texts:
+        content = text.casefold()
+        for phrase in phrases:
+            if phrase in content:
+                counts[phrase] += 1
+
+    return counts
+
+
+def make_replies(phrases, count, length=20, seed=0):
+    generator = random.Random(seed)
+    replies = []
+    for _ in range(count):
+        reply = [generator.choice(words) for _ in range(length)]
+        if generator.random() < 0.2:
+            reply.insert(generator.randrange(length), generator.choice(phrases))
+        replies.append(" ".join(reply))
+
+    return replies
+
+
+def main(count=10000, repeat=5):
+    configured = load_phrases("phrases.txt")
+
+    # The configured phrases and longer lists, to show how both scale.
+    for extra in (0, 25, 100):
+        phrases = configured + [f"made up phrase {i}" for i in range(extra)]
+        replies = make_replies(phrases, count)
+        matcher = PhraseMatcher(phrases)
+
+        assert matcher.count(replies) == count_separately(replies, matcher.phrases)
+
+        print(f"{len(phrases)} phrases, {count} replies:")
+        for name, function in [
+            ("separate scans", lambda: count_separately(replies, phrases)),
+            ("phrase matcher", lambda: matcher.count(replies)),
+        ]:
+            best = min(timeit.repeat(function, number=1, repeat=repeat))
+            print(f"  {name}: {best * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(*(int(argument) for argument in sys.argv[1:2]))
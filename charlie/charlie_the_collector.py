@@ -1,23 +1,43 @@
 import asyncio
+import collections
+import datetime
 import logging
 logging.basicConfig(format='%(asctime)s:%(levelname)s:%(name)s:%(message)s')
-import praw
+import traceback
+
+import prawcore
 
 import database
-import passwords_and_tokens
+import reddit_api
+from phrases import PhraseMatcher, load_phrases
+from reddit_api import reddit
+
+# Leaves most of the allowance to reddit_stats, which shares the account.
+budget = reddit_api.share(0.3)
+
+MINUTE = datetime.timedelta(minutes=1)
+HOUR = datetime.timedelta(hours=1)
+DAY = datetime.timedelta(days=1)
 
-reddit = praw.Reddit(
-    client_id=passwords_and_tokens.reddit_id,
-    client_secret=passwords_and_tokens.reddit_token,
-    user_agent="Lornebot 0.0.1",
-    check_for_async=False
-)
+# These have their own columns in transcriptions, they are always counted.
+stat_phrases = ["good bot", "bad bot", "good human", "bad human"]
+matcher = PhraseMatcher(stat_phrases + load_phrases("phrases.txt"))
 
 
-async def analyze_transcription(transcription, refresh_retries=3):
+async def analyze_transcription(transcription, seen=frozenset(), refresh_retries=3):
+    """
+    Reads the replies to a transcription that aren't in `seen` yet.
+
+    Returns the stats of the new replies as a row for write_stats, the number of them
+    containing each phrase that was found and (reply id, phrases) for each of them.
+    Returns None if the transcription couldn't be refreshed.
+    """
+    # Newest first, so the replies that weren't seen yet come with the refresh.
+    transcription.reply_sort = "new"
+
     for i in range(refresh_retries):
         try:
-            transcription.refresh()
+            await reddit_api.call(transcription.refresh, budget=budget)
         except Exception:
             continue
         else:
@@ -31,104 +51,390 @@ async def analyze_transcription(transcription, refresh_retries=3):
             f"Could not get information after {refresh_retries} refreshes "
             f"for transcription: {transcription.id}"
         )
+        return None
+
+    replies = transcription.replies
+    if replies is None:
+        logging.info(f"No replies to transcription: {transcription.id}")
+        replies = []
+    else:
+        # With a limit of 0 this only drops the "load more" stubs, it sends no
+        # requests. Replies past the ones that came with the refresh aren't read.
+        replies.replace_more(0)
+
+    # Only phrases that were found get a count, the rest are 0.
+    counts = collections.Counter()
+    new_replies = []
+    for comment in replies:
+        if comment.id in seen:
+            continue
+
+        found = matcher.find(comment.body)
+        counts.update(found)
+        new_replies.append((comment.id, sorted(found)))
+
+    comment_count = len(new_replies)
+    good_bot, bad_bot, good_human, bad_human = (
+        counts[phrase] for phrase in stat_phrases
+    )
+
+    logging.info(
+        f"New stats for transcription {transcription.id}: "
+        f"{good_bot} {bad_bot} {good_human} {bad_human} {comment_count} "
+        f"{transcription.score}"
+    )
+
+    row = (
+        transcription.id,
+        good_bot,
+        bad_bot,
+        good_human,
+        bad_human,
+        comment_count,
+        transcription.score,
+    )
+    return row, counts, new_replies
+
 
-        async with database.get_connection() as connection:
+async def fetch_seen_replies(comment_ids):
+    """Returns the ids of the replies that were read before for each transcription."""
+    async with database.get_connection() as connection:
+        rows = await connection.fetch(
+            """
+            SELECT comment_id, reply_id
+            FROM seen_replies
+            WHERE comment_id = ANY($1::text[]);
+            """,
+            comment_ids,
+        )
+
+    seen = {comment_id: set() for comment_id in comment_ids}
+    for comment_id, reply_id in rows:
+        seen[comment_id].add(reply_id)
+
+    return seen
+
+
+async def write_stats(stats, phrase_counts, replies, reset, failed, retries=6):
+    """
+    Adds the stats and phrase counts of the new replies of many transcriptions in one
+    statement each and remembers the replies.
+
+    Transcriptions that couldn't be refreshed keep their stats and are tried again
+    after an exponential backoff, after `retries` failures in a row they are marked
+    as errors and left alone.
+
+    The totals of the transcriptions in `reset` are replaced instead, their replies
+    weren't tracked before.
+    """
+    # One array per column, the same way the rows are unpacked by UNNEST.
+    columns = [list(column) for column in zip(*stats)] or [[]] * 7
+    # 0 drops the old totals, 1 keeps them.
+    keep = [int(row[0] not in reset) for row in stats]
+    counted_again = [row[0] for row in stats if row[0] in reset]
+
+    async with database.get_connection() as connection:
+        async with connection.transaction():
             await connection.execute(
                 """
                 UPDATE transcriptions
-                    SET good_bot = 0,
-                    bad_bot = 0,
-                    good_human = 0,
-                    bad_human = 0,
-                    comment_count = 0,
-                    upvotes = 0,
+                    SET good_bot = transcriptions.good_bot * stats.keep
+                        + stats.good_bot,
+                    bad_bot = transcriptions.bad_bot * stats.keep + stats.bad_bot,
+                    good_human = transcriptions.good_human * stats.keep
+                        + stats.good_human,
+                    bad_human = transcriptions.bad_human * stats.keep
+                        + stats.bad_human,
+                    comment_count = transcriptions.comment_count * stats.keep
+                        + stats.comment_count,
+                    upvotes = stats.upvotes,
                     last_checked = NOW(),
-                    error = true
-                WHERE comment_id = $1;
+                    replies_checked = NOW(),
+                    failed_refreshes = 0,
+                    error = FALSE
+                FROM UNNEST(
+                    $1::text[],
+                    $2::integer[],
+                    $3::integer[],
+                    $4::integer[],
+                    $5::integer[],
+                    $6::integer[],
+                    $7::integer[],
+                    $8::integer[]
+                ) AS stats (
+                    comment_id,
+                    good_bot,
+                    bad_bot,
+                    good_human,
+                    bad_human,
+                    comment_count,
+                    upvotes,
+                    keep
+                )
+                WHERE transcriptions.comment_id = stats.comment_id;
                 """,
-                transcription.id,
+                *columns,
+                keep,
             )
-            return
 
-    replies = transcription.replies
-    if replies is None:
-        logging.info(f"No replies to transcription: {transcription.id}")
-        return
+            # Reset transcriptions are counted again from scratch.
+            await connection.execute(
+                """
+                DELETE FROM phrase_counts
+                WHERE comment_id = ANY($1::text[]);
+                """,
+                counted_again,
+            )
+            await connection.execute(
+                """
+                DELETE FROM seen_replies
+                WHERE comment_id = ANY($1::text[]);
+                """,
+                counted_again,
+            )
 
-    replies.replace_more(0)
+            await connection.execute(
+                """
+                INSERT INTO phrase_counts (comment_id, phrase, count)
+                    SELECT comment_id, phrase, count
+                    FROM UNNEST($1::text[], $2::text[], $3::integer[])
+                        AS counts (comment_id, phrase, count)
+                ON CONFLICT (comment_id, phrase) DO UPDATE
+                    SET count = phrase_counts.count + EXCLUDED.count;
+                """,
+                [comment_id for comment_id, phrase, count in phrase_counts],
+                [phrase for comment_id, phrase, count in phrase_counts],
+                [count for comment_id, phrase, count in phrase_counts],
+            )
 
-    comment_count = good_bot = bad_bot = good_human = bad_human = 0
+            # The phrase arrays differ in length, so they can't be unnested.
+            await connection.executemany(
+                """
+                INSERT INTO seen_replies (comment_id, reply_id, phrases)
+                    VALUES ($1, $2, $3::text[])
+                ON CONFLICT DO NOTHING;
+                """,
+                replies,
+            )
 
-    for comment in replies:
-        comment_count += 1
-        content = comment.body.casefold()
-        if "good bot" in content:
-            good_bot += 1
+            await connection.execute(
+                """
+                UPDATE transcriptions
+                    SET last_checked = NOW(),
+                    failed_refreshes = failed_refreshes + 1,
+                    error = failed_refreshes + 1 >= $2,
+                    next_check_at = CASE WHEN failed_refreshes + 1 < $2 THEN NOW()
+                        + interval '5 minutes' * POWER(2, failed_refreshes) END
+                WHERE comment_id = ANY($1::text[]);
+                """,
+                failed,
+                retries,
+            )
 
-        if "bad bot" in content:
-            bad_bot += 1
 
-        if "good human" in content:
-            good_human += 1
+async def refresh_transcriptions(comment_ids, workers=4):
+    """
+    Reads the replies of the transcriptions with a pool of workers, they all take
+    their requests from charlie's budget. The stats are written together once all
+    of them were read.
+    """
+    queue = asyncio.Queue()
+    for comment_id in comment_ids:
+        queue.put_nowait(comment_id)
 
-        if "bad human" in content:
-            bad_human += 1
+    seen = await fetch_seen_replies(comment_ids)
+    # Transcriptions without seen replies are read in full, their totals replaced.
+    reset = {comment_id for comment_id in comment_ids if len(seen[comment_id]) == 0}
 
-    logging.info(
-        f"Stats for transcription {transcription.id}: "
-        f"{good_bot} {bad_bot} {good_human} {bad_human} {comment_count} "
-        f"{transcription.score}"
-    )
+    stats = []
+    phrase_counts = []
+    replies = []
+    failed = []
+
+    async def worker():
+        while not queue.empty():
+            comment_id = queue.get_nowait()
+            # The author isn't known until the transcription is refreshed.
+            logging.info(f"Analyzing transcription: {comment_id}")
+            result = await analyze_transcription(
+                reddit.comment(comment_id), seen[comment_id]
+            )
+            if result is None:
+                failed.append(comment_id)
+                continue
+
+            row, counts, new_replies = result
+            stats.append(row)
+            phrase_counts.extend(
+                (comment_id, phrase, count) for phrase, count in counts.items()
+            )
+            replies.extend(
+                (comment_id, reply_id, phrases) for reply_id, phrases in new_replies
+            )
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+    if len(stats) > 0 or len(failed) > 0:
+        await write_stats(stats, phrase_counts, replies, reset, failed)
+
+
+def next_check(posted, last_checked, changed, now, retire_after=2 * DAY):
+    """
+    When a transcription is checked next, None once it is old enough to be left
+    alone.
+
+    Young transcriptions are checked every few minutes, the interval grows with
+    their age. Transcriptions whose score didn't change wait twice as long as last
+    time, up to the interval of a transcription twice their age.
+    """
+    age = now - posted
+    if age > retire_after:
+        return None
 
+    interval = min(max(age / 12, 5 * MINUTE), 6 * HOUR)
+    if changed is False and last_checked is not None:
+        interval = min(max(interval, 2 * (now - last_checked)), age / 6 + 5 * MINUTE)
+
+    return now + interval
+
+
+async def update_scores(scores, next_checks):
+    """
+    Writes the scores read for many transcriptions in one statement. Transcriptions
+    without a score keep their old one.
+    """
     async with database.get_connection() as connection:
         await connection.execute(
             """
             UPDATE transcriptions
-                SET good_bot = $1,
-                bad_bot = $2,
-                good_human = $3,
-                bad_human = $4,
-                comment_count = $5,
-                upvotes = $6,
+                SET upvotes = COALESCE(scores.score, transcriptions.upvotes),
                 last_checked = NOW(),
-                error = FALSE
-            WHERE comment_id = $7;
+                next_check_at = scores.next_check_at
+            FROM UNNEST($1::text[], $2::integer[], $3::timestamptz[])
+                AS scores (comment_id, score, next_check_at)
+            WHERE transcriptions.comment_id = scores.comment_id;
             """,
-            good_bot,
-            bad_bot,
-            good_human,
-            bad_human,
-            comment_count,
-            transcription.score,
-            transcription.id,
+            list(next_checks),
+            [scores.get(comment_id) for comment_id in next_checks],
+            list(next_checks.values()),
         )
 
 
-async def analyze_all_transcriptions(delay=4.0):
+async def analyze_all_transcriptions(
+    stale_after=6 * 60 * 60, limit=1000, backlog=25, retire_after=2 * DAY
+):
+    """
+    Checks the transcriptions that are due in two steps. The scores of a hundred
+    transcriptions are read with a single request, only the transcriptions whose
+    score changed or whose replies weren't read for `stale_after` seconds get their
+    replies read.
+
+    Transcriptions that were already old when they were added, like the ones
+    imported from dumps or found while backfilling a user, have no next_check_at.
+    They get a single check, `backlog` of them at a time, so they don't hold up the
+    young ones.
+    """
     async with database.get_connection() as connection:
         transcriptions = await connection.fetch(
             """
-            SELECT comment_id
-            FROM transcriptions
-            WHERE EXTRACT(epoch FROM NOW()) - EXTRACT(epoch FROM found) < (24 * 60 * 60)
-                OR last_checked IS NULL OR good_bot IS NULL OR bad_bot IS NULL
-                OR good_human IS NULL OR bad_human IS NULL
-            ORDER BY last_checked ASC;
-            """
+            SELECT
+                comment_id,
+                upvotes,
+                COALESCE(created, found) AS posted,
+                last_checked,
+                replies_checked IS NULL
+                    OR replies_checked < NOW() - $1::integer * interval '1 second' AS stale
+            FROM (
+                (
+                    SELECT
+                        comment_id,
+                        upvotes,
+                        created,
+                        found,
+                        last_checked,
+                        replies_checked
+                    FROM transcriptions
+                    WHERE next_check_at <= NOW()
+                    ORDER BY next_check_at ASC
+                    LIMIT $2
+                )
+                UNION ALL
+                (
+                    SELECT
+                        comment_id,
+                        upvotes,
+                        created,
+                        found,
+                        last_checked,
+                        replies_checked
+                    FROM transcriptions
+                    WHERE next_check_at IS NULL
+                        AND last_checked IS NULL
+                        AND error = FALSE
+                    ORDER BY found ASC
+                    LIMIT $3
+                )
+            ) AS due;
+            """,
+            stale_after,
+            limit,
+            backlog,
         )
 
-    if transcriptions is None:
+    if len(transcriptions) == 0:
         logging.info("There are no transcriptions to analyze.")
         return
 
-    transcriptions = [reddit.comment(row["comment_id"]) for row in transcriptions]
-    for transcription in transcriptions:
+    for i in range(0, len(transcriptions), 100):
+        rows = transcriptions[i : i + 100]
+        try:
+            comments = await reddit_api.info(
+                [f"t1_{row['comment_id']}" for row in rows], budget
+            )
+        except prawcore.exceptions.PrawcoreException:
+            # The rows stay due, they are read again next time.
+            logging.warn(
+                f"Could not read the scores of {len(rows)} transcriptions:\n"
+                f"{traceback.format_exc()}"
+            )
+            continue
+
+        scores = {comment.id: comment.score for comment in comments}
+        # Comments Reddit doesn't return anymore count as unchanged, so they are
+        # still checked less often and eventually retired.
+        changed_scores = {
+            row["comment_id"]
+            for row in rows
+            if row["comment_id"] in scores
+            and scores[row["comment_id"]] != row["upvotes"]
+        }
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        next_checks = {
+            row["comment_id"]: next_check(
+                row["posted"],
+                row["last_checked"],
+                row["comment_id"] in changed_scores,
+                now,
+                retire_after,
+            )
+            for row in rows
+        }
+        await update_scores(scores, next_checks)
+
+        # Comments don't have a reply count, a changed score shows they are active.
+        changed = [
+            row["comment_id"]
+            for row in rows
+            if row["comment_id"] in changed_scores
+            or (row["stale"] and row["comment_id"] in scores)
+        ]
         logging.info(
-            f"Analyzing /u/{transcription.author}'s transcription: {transcription.id}"
+            f"Read the scores of {len(rows)} transcriptions, "
+            f"{len(changed)} need their replies read."
         )
-        await analyze_transcription(transcription)
-        # Wait a bit to not "steal" all the API calls
-        await asyncio.sleep(delay)
+
+        await refresh_transcriptions(changed)
 
 
 async def analyze_loop(timeout=60.0):
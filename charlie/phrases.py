@@ -0,0 +1,89 @@
+import re
+
+
+def load_phrases(path):
+    """Reads one phrase per line, blank lines and lines starting with # are skipped."""
+    with open(path, "r") as stream:
+        lines = [line.strip().casefold() for line in stream]
+
+    return [line for line in lines if line != "" and not line.startswith("#")]
+
+
+def trie_regex(phrases):
+    """
+    Combines the phrases into one regex shaped like a trie, "good bot" and
+    "good human" become "good (?:bot|human)". Phrases that share a beginning are
+    tried together, so adding phrases barely slows it down.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for character in phrase:
+            node = node.setdefault(character, {})
+        # Marks the end of a phrase.
+        node[""] = {}
+
+    def build(node):
+        alternatives = [
+            re.escape(character) + build(child)
+            for character, child in sorted(node.items())
+            if character != ""
+        ]
+        if len(alternatives) == 0:
+            return ""
+
+        if len(alternatives) == 1:
+            pattern = alternatives[0]
+        else:
+            pattern = f"(?:{'|'.join(alternatives)})"
+
+        # A phrase ends here, the longer ones are optional and tried first.
+        if "" in node:
+            return f"(?:{pattern})?"
+
+        return pattern
+
+    return build(trie)
+
+
+class PhraseMatcher:
+    """
+    Finds which of a set of phrases a text contains, case insensitive.
+
+    All phrases are combined into one regex that finds the longest phrase starting
+    at a position. A shorter phrase starting at the same position is a prefix of
+    that one, so it is found through it.
+    """
+
+    def __init__(self, phrases):
+        self.phrases = sorted({phrase.casefold() for phrase in phrases})
+        self.regex = re.compile(trie_regex(self.phrases))
+
+        self.prefixes = {
+            phrase: {prefix for prefix in self.phrases if phrase.startswith(prefix)}
+            for phrase in self.phrases
+        }
+
+    def find(self, text):
+        """Returns the set of phrases the text contains."""
+        found = set()
+        if len(self.phrases) == 0:
+            return found
+
+        text = text.casefold()
+        match = self.regex.search(text)
+        while match is not None:
+            found |= self.prefixes[match.group()]
+            # Phrases may overlap, the next one can start right after this one.
+            match = self.regex.search(text, match.start() + 1)
+
+        return found
+
+    def count(self, texts):
+        """Returns how many of the texts contain each phrase."""
+        counts = dict.fromkeys(self.phrases, 0)
+        for text in texts:
+            for phrase in self.find(text):
+                counts[phrase] += 1
+
+        return counts
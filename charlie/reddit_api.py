@@ -0,0 +1,251 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+import traceback
+
+import praw
+
+import database
+import passwords_and_tokens
+
+
+def _per_thread(name):
+    """A Reddit attribute that has its own value in every thread."""
+
+    def get(self):
+        local = self._thread_local
+        if not getattr(local, "prepared", False) and self._prawcore_arguments:
+            args, kwargs = self._prawcore_arguments
+            self._prepare_prawcore(*args, **kwargs)
+
+        return getattr(local, name, None)
+
+    def set(self, value):
+        setattr(self._thread_local, name, value)
+
+    return property(get, set)
+
+
+class ThreadLocalReddit(praw.Reddit):
+    """
+    A Reddit instance with a separate connection in every thread.
+
+    PRAW isn't thread-safe, its HTTP session, rate limiter and authorization are
+    shared by everything that uses the instance. They are kept in the prawcore
+    sessions, so every executor thread sets up its own the first time it sends a
+    request. Objects can still be made on the event loop and fetched by any thread.
+    """
+
+    _core = _per_thread("_core")
+    _authorized_core = _per_thread("_authorized_core")
+    _read_only_core = _per_thread("_read_only_core")
+
+    def __init__(self, *args, **kwargs):
+        self._thread_local = threading.local()
+        self._prawcore_arguments = None
+        super().__init__(*args, **kwargs)
+
+    def _prepare_prawcore(self, *args, **kwargs):
+        self._prawcore_arguments = (args, kwargs)
+        self._thread_local.prepared = True
+        super()._prepare_prawcore(*args, **kwargs)
+
+
+reddit = ThreadLocalReddit(
+    client_id=passwords_and_tokens.reddit_id,
+    client_secret=passwords_and_tokens.reddit_token,
+    user_agent="Lornebot 0.0.1",
+    check_for_async=False
+)
+
+# PRAW is synchronous, the requests are run here so they don't block the event loop.
+executor = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+
+# Every service uses the same account. Commands people are waiting on come first,
+# flair checks second, everything else uses what is left.
+INTERACTIVE = 0
+FLAIR = 1
+BACKGROUND = 2
+
+# Requests of the allowance each priority leaves to the ones above it.
+RESERVES = {INTERACTIVE: 0, FLAIR: 50, BACKGROUND: 200}
+
+
+class RequestBudget:
+    """A token bucket shared by everything that sends requests to Reddit.
+
+    Allows `requests` requests every `period` seconds with bursts of up to `burst`.
+    A budget with a parent is a share of the parent, requests are taken from both.
+    With a `fraction` the share follows the rate of the parent.
+    """
+
+    def __init__(
+        self,
+        requests=60,
+        period=60.0,
+        burst=5,
+        parent=None,
+        fraction=None,
+        priority=INTERACTIVE,
+    ):
+        self.rate = requests / period
+        self.burst = burst
+        self.max_burst = burst
+        self.parent = parent
+        self.fraction = fraction
+        self.priority = priority
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            if self.fraction is not None:
+                self.rate = self.parent.rate * self.fraction
+
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._tokens = 1
+                self._updated = time.monotonic()
+
+            self._tokens -= 1
+
+        if self.parent is not None:
+            await self.parent.acquire()
+
+    def adapt(self, remaining, reset_timestamp, reserve=10):
+        """
+        Spreads the requests left in Reddit's allowance over the time until it resets.
+
+        With most of the allowance left requests go out in bursts, as it runs out they
+        are slowed down so the last few `reserve` requests last until the reset.
+        """
+        window = reset_timestamp - time.time()
+        if window <= 0:
+            return
+
+        self.rate = max(remaining - reserve, 1) / window
+        self.burst = max(1, min(self.max_burst, int(remaining / reserve)))
+
+
+# Starts at Reddit's documented limit until the first response tells what is left.
+default_budget = RequestBudget(requests=60, period=60.0, burst=30)
+
+
+def share(fraction, priority=BACKGROUND):
+    """Creates a part of the budget that is limited to a fraction of its rate."""
+    return RequestBudget(parent=default_budget, fraction=fraction, priority=priority)
+
+
+class SharedAllowance:
+    """
+    The Reddit allowance of the account, kept in the database so every service knows
+    how much of it the others used.
+
+    A request is only sent while more than the reserve of its priority is left,
+    otherwise it waits for the allowance to reset.
+    """
+
+    def __init__(self, poll=1.0):
+        self.poll = poll
+
+    async def acquire(self, priority):
+        if database.pool is None:
+            return
+
+        while True:
+            async with database.get_connection() as connection:
+                granted = await connection.fetchval(
+                    """
+                    UPDATE reddit_allowance
+                    SET remaining = remaining - 1
+                    WHERE remaining > $1 OR reset <= NOW()
+                    RETURNING TRUE;
+                    """,
+                    RESERVES[priority],
+                )
+                if granted is True:
+                    return
+
+                wait = await connection.fetchval(
+                    "SELECT EXTRACT(epoch FROM reset - NOW()) FROM reddit_allowance;"
+                )
+
+            await asyncio.sleep(max(wait or 0, self.poll))
+
+    async def update(self, remaining, reset_timestamp):
+        if database.pool is None:
+            return
+
+        async with database.get_connection() as connection:
+            await connection.execute(
+                """
+                UPDATE reddit_allowance
+                SET
+                    remaining = $1,
+                    reset = to_timestamp($2);
+                """,
+                int(remaining),
+                reset_timestamp,
+            )
+
+
+allowance = SharedAllowance()
+
+
+def _run(function, args, kwargs, limits):
+    """Runs a call on the executor and copies the rate limits of its thread."""
+    try:
+        return function(*args, **kwargs)
+    finally:
+        # PRAW keeps the X-Ratelimit headers of the last response in each session.
+        limits.update(reddit.auth.limits)
+
+
+async def call(function, *args, budget=None, **kwargs):
+    """
+    Calls a function that sends a Reddit request once the budget allows it.
+    `budget` can be a share of the budget to take the request from.
+
+    Each call is counted as one request, a function that sends several requests has
+    to be split into several calls.
+    """
+    if budget is None:
+        budget = default_budget
+
+    await budget.acquire()
+    await allowance.acquire(budget.priority)
+
+    limits = {}
+    loop = asyncio.get_event_loop()
+    try:
+        return await loop.run_in_executor(executor, _run, function, args, kwargs, limits)
+    finally:
+        if limits.get("remaining") is not None and limits.get("reset_timestamp"):
+            default_budget.adapt(limits["remaining"], limits["reset_timestamp"])
+            try:
+                await allowance.update(limits["remaining"], limits["reset_timestamp"])
+            except Exception:
+                # Callers catch Reddit's exceptions by type, a failed write mustn't
+                # replace them.
+                logging.warn(
+                    f"Could not update the shared allowance:\n{traceback.format_exc()}"
+                )
+
+
+async def info(fullnames, budget=None):
+    """Fetches comments, submissions or subreddits by fullname, a hundred per request."""
+    things = []
+    for i in range(0, len(fullnames), 100):
+        chunk = fullnames[i : i + 100]
+        things.extend(await call(list, reddit.info(fullnames=chunk), budget=budget))
+
+    return things
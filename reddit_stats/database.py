@@ -25,3 +25,31 @@ async def create_pool():
 
 async def close_pool():
     await pool.close()
+
+
+class AdvisoryLock:
+    """
+    Holds a session advisory lock on a key while in use, so only one process works on
+    the key at a time. Entering returns whether the lock was taken.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.connection = None
+        self.locked = False
+
+    async def __aenter__(self):
+        self.connection = await get_connection()
+        self.locked = await self.connection.fetchval(
+            "SELECT pg_try_advisory_lock(hashtext($1));", self.key
+        )
+        return self.locked
+
+    async def __aexit__(self, exception_type, exception, traceback):
+        try:
+            if self.locked is True:
+                await self.connection.execute(
+                    "SELECT pg_advisory_unlock(hashtext($1));", self.key
+                )
+        finally:
+            await pool.release(self.connection)
@@ -1,57 +1,77 @@
 import asyncio
-import praw
 import logging
 logging.basicConfig(format='%(asctime)s:%(levelname)s:%(name)s:%(message)s')
+import sys
+import time
 
 import database
-import passwords_and_tokens
+import reddit_api
 
-reddit = praw.Reddit(
-    client_id=passwords_and_tokens.reddit_id,
-    client_secret=passwords_and_tokens.reddit_token,
-    user_agent="Lornebot 0.0.1",
-    check_for_async=False
-)
+# A one-off backfill, it only uses what the other services leave.
+budget = reddit_api.share(1.0)
 
 
-async def main():
+async def main(after=""):
+    """
+    Fills in the missing permalinks of transcriptions, a hundred at a time.
+
+    Transcriptions are read in comment id order, a stopped run can be resumed by
+    passing the last comment id it logged.
+    """
     await database.create_pool()
 
-    async with database.get_connection() as connection:
-        rows = await connection.fetch(
-            """
-            SELECT
-                comment_id
-            FROM transcriptions
-            WHERE permalink IS NULL;
-            """
-        )
+    started = time.monotonic()
+    resolved = skipped = 0
+
+    async with database.get_connection() as reader:
+        # Cursors only live inside a transaction.
+        async with reader.transaction():
+            cursor = await reader.cursor(
+                """
+                SELECT
+                    comment_id
+                FROM transcriptions
+                WHERE permalink IS NULL AND comment_id > $1
+                ORDER BY comment_id ASC;
+                """,
+                after,
+            )
+
+            while True:
+                rows = await cursor.fetch(100)
+                if len(rows) == 0:
+                    break
 
-        if rows is None:
-            return
+                comment_ids = [row["comment_id"] for row in rows]
+                comments = await reddit_api.info(
+                    [f"t1_{comment_id}" for comment_id in comment_ids], budget
+                )
 
-        comment_ids = [row["comment_id"] for row in rows]
+                # Deleted comments aren't returned at all.
+                permalinks = {comment.id: comment.permalink for comment in comments}
 
-        for comment_id in comment_ids:
-            comment = reddit.comment(comment_id)
+                async with database.get_connection() as writer:
+                    await writer.execute(
+                        """
+                        UPDATE transcriptions
+                            SET permalink = resolved.permalink
+                        FROM UNNEST($1::text[], $2::text[])
+                            AS resolved (comment_id, permalink)
+                        WHERE transcriptions.comment_id = resolved.comment_id;
+                        """,
+                        list(permalinks),
+                        list(permalinks.values()),
+                    )
 
-            try:
-                permalink = comment.permalink
-            except ValueError:
+                resolved += len(permalinks)
+                skipped += len(comment_ids) - len(permalinks)
+                rate = (resolved + skipped) / (time.monotonic() - started)
                 logging.info(
-                    f"Comment {comment_id} skipped because it has no permalink"
+                    f"Resolved {resolved} permalinks, skipped {skipped} comments "
+                    f"({rate:.1f} per second). Resume with: {comment_ids[-1]}"
                 )
-                continue
 
-            await connection.execute(
-                """
-                UPDATE transcriptions
-                    SET permalink = $1
-                WHERE comment_id = $2
-                """,
-                permalink,
-                comment_id,
-            )
+    logging.info(f"Done, resolved {resolved} permalinks and skipped {skipped}.")
 
 
 if __name__ == "__main__":
@@ -59,4 +79,4 @@ if __name__ == "__main__":
 
     loop = asyncio.get_event_loop()
 
-    loop.run_until_complete(main())
+    loop.run_until_complete(main(*sys.argv[1:2]))
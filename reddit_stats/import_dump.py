@@ -0,0 +1,246 @@
+import asyncio
+import bz2
+import datetime
+import gzip
+import io
+import json
+import logging
+logging.basicConfig(format='%(asctime)s:%(levelname)s:%(name)s:%(message)s')
+import lzma
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import database
+from transcriptions import is_transcription_text
+
+columns = ["comment_id", "transcriber", "content", "subreddit", "permalink", "created"]
+
+
+def open_dump(path):
+    """Opens a newline-delimited JSON dump as text, decompressing it on the fly."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+    if path.endswith(".xz"):
+        return lzma.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} needs the zstandard package.")
+
+        # Reddit dumps are compressed with a long window.
+        decompressor = zstandard.ZstdDecompressor(max_window_size=2 ** 31)
+        stream = decompressor.stream_reader(open(path, "rb"))
+        return io.TextIOWrapper(stream, encoding="utf-8")
+
+    return open(path, "r", encoding="utf-8")
+
+
+def read_comment(comment):
+    """Turns a comment from a dump into a row for import_transcriptions."""
+    permalink = comment.get("permalink")
+    if permalink is None:
+        # Older dumps have no permalinks.
+        permalink = (
+            f"/r/{comment['subreddit']}/comments/{comment['link_id'][3:]}"
+            f"/_/{comment['id']}/"
+        )
+
+    return (
+        comment["id"],
+        comment["author"],
+        comment["body"],
+        comment["subreddit_id"][3:],
+        permalink,
+        datetime.datetime.fromtimestamp(
+            float(comment["created_utc"]), datetime.timezone.utc
+        ),
+    )
+
+
+def read_dumps(paths, transcribers, results, batch=1000):
+    """
+    Runs in its own process. Reads the dumps and puts the transcriptions of known
+    transcribers on `results` in lists of up to `batch`, then None once done.
+    """
+    try:
+        for path in paths:
+            try:
+                read_dump(path, transcribers, results, batch)
+            except Exception:
+                logging.warn(
+                    f"Could not read {path}, skipping the rest of it:\n"
+                    f"{traceback.format_exc()}"
+                )
+    finally:
+        # main waits for one None per reader.
+        results.put(None)
+
+
+def read_dump(path, transcribers, results, batch):
+    """Reads one dump for read_dumps, comments that are missing fields are skipped."""
+    lines = found = skipped = 0
+    records = []
+    with open_dump(path) as stream:
+        for line in stream:
+            lines += 1
+            try:
+                comment = json.loads(line)
+            except ValueError:
+                continue
+
+            if not isinstance(comment, dict):
+                continue
+
+            author = comment.get("author")
+            if not isinstance(author, str) or author.casefold() not in transcribers:
+                continue
+
+            try:
+                if not is_transcription_text(
+                    comment["body"], float(comment["created_utc"])
+                ):
+                    continue
+
+                record = read_comment(comment)
+            except (KeyError, TypeError, ValueError):
+                # Some dumps have comments without a body, time or subreddit.
+                skipped += 1
+                continue
+
+            records.append(record)
+            found += 1
+            if len(records) >= batch:
+                results.put(records)
+                records = []
+
+    if len(records) > 0:
+        results.put(records)
+
+    logging.info(
+        f"Read {lines} comments from {path}, {found} transcriptions, "
+        f"skipped {skipped} malformed ones."
+    )
+
+
+async def copy_transcriptions(connection, records):
+    """
+    Copies the records into the staging table and adds the new ones as transcriptions.
+    Returns the number of transcriptions that weren't in the database yet.
+    """
+    async with connection.transaction():
+        await connection.copy_records_to_table(
+            "import_transcriptions", records=records, columns=columns
+        )
+        inserted = await connection.fetch(
+            """
+            INSERT INTO transcriptions (
+                    comment_id,
+                    transcriber,
+                    content,
+                    subreddit,
+                    found,
+                    permalink,
+                    created,
+                    next_check_at
+                )
+                SELECT
+                    comment_id,
+                    transcriber,
+                    content,
+                    subreddit,
+                    NOW(),
+                    permalink,
+                    created,
+                    -- Old ones are only checked once by charlie.
+                    CASE WHEN created > NOW() - interval '2 days' THEN NOW() END
+                FROM import_transcriptions
+            ON CONFLICT DO NOTHING
+            RETURNING comment_id;
+            """
+        )
+
+    return len(inserted)
+
+
+async def main(paths, processes=None):
+    """
+    Imports the transcriptions in Reddit comment dumps, one process reads each dump.
+    Only comments of users that are already transcribers are kept.
+    """
+    processes = min(processes or os.cpu_count(), len(paths))
+
+    await database.create_pool()
+
+    async with database.get_connection() as connection:
+        rows = await connection.fetch("SELECT name FROM transcribers;")
+    transcribers = {row["name"].casefold() for row in rows}
+
+    # Bounded, so the readers wait while the database catches up.
+    results = multiprocessing.Queue(maxsize=processes * 4)
+    readers = [
+        multiprocessing.Process(
+            target=read_dumps, args=(paths[i::processes], transcribers, results)
+        )
+        for i in range(processes)
+    ]
+    for reader in readers:
+        reader.start()
+
+    loop = asyncio.get_event_loop()
+    started = time.monotonic()
+    running = len(readers)
+    found = imported = 0
+
+    async with database.get_connection() as connection:
+        await connection.execute(
+            """
+            CREATE TEMPORARY TABLE import_transcriptions (
+                comment_id text,
+                transcriber text,
+                content text,
+                subreddit text,
+                permalink text,
+                created timestamp with time zone
+            ) ON COMMIT DELETE ROWS;
+            """
+        )
+
+        while running > 0:
+            records = await loop.run_in_executor(None, results.get)
+            if records is None:
+                running -= 1
+                continue
+
+            found += len(records)
+            imported += await copy_transcriptions(connection, records)
+            rate = found / (time.monotonic() - started)
+            logging.info(
+                f"Found {found} transcriptions, {imported} were new "
+                f"({rate:.1f} per second)."
+            )
+
+    for reader in readers:
+        reader.join()
+
+    logging.info(f"Done, imported {imported} of {found} transcriptions.")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+
+    if len(sys.argv) < 2:
+        print("Usage: import_dump.py DUMP [DUMP ...]")
+        sys.exit(1)
+
+    loop = asyncio.get_event_loop()
+
+    loop.run_until_complete(main(sys.argv[1:]))
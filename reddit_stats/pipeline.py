@@ -0,0 +1,94 @@
+import asyncio
+import logging
+
+
+class Stage:
+    """
+    A step of the scanner with its own pool of workers.
+
+    Items wait in a bounded queue, so whoever submits them is held back once the
+    stage falls behind. submit returns what `handle` returned for the item, put only
+    waits for room in the queue and returns a future for it.
+    """
+
+    def __init__(self, name, handle, workers=1, maxsize=100):
+        self.name = name
+        self.handle = handle
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.processed = 0
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    async def put(self, item):
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((item, future))
+        return future
+
+    async def submit(self, item):
+        return await (await self.put(item))
+
+    async def run(self):
+        await asyncio.gather(*(self._worker() for _ in range(self.workers)))
+
+    async def _worker(self):
+        while True:
+            item, future = await self.queue.get()
+            try:
+                result = await self.handle(item)
+            except Exception as exception:
+                result = exception
+
+            self._resolve(future, result)
+            self.processed += 1
+
+    @staticmethod
+    def _resolve(future, result):
+        # The caller may have stopped waiting.
+        if future.done():
+            return
+
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+
+class BatchStage(Stage):
+    """
+    A stage that handles whatever is queued together, up to `batch` items at a time.
+
+    `handle` is given a list of items and returns a list with a result for each one,
+    a result that is an exception is raised to the caller of that item only.
+    """
+
+    def __init__(self, name, handle, workers=1, maxsize=100, batch=50):
+        super().__init__(name, handle, workers, maxsize)
+        self.batch = batch
+
+    async def _worker(self):
+        while True:
+            pending = [await self.queue.get()]
+            while len(pending) < self.batch and not self.queue.empty():
+                pending.append(self.queue.get_nowait())
+
+            items = [item for item, future in pending]
+            try:
+                results = await self.handle(items)
+            except Exception as exception:
+                results = [exception] * len(items)
+
+            for (item, future), result in zip(pending, results):
+                self._resolve(future, result)
+
+            self.processed += len(items)
+
+
+async def report(queues, interval=60.0):
+    """Logs how many items are waiting in each queue every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+
+        depths = ", ".join(f"{name}: {queue.qsize()}" for name, queue in queues.items())
+        logging.info(f"Queued items: {depths}")
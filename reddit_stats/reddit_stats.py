@@ -1,372 +1,522 @@
 import asyncio
 import datetime
+import json
 import logging
 logging.basicConfig(format='%(asctime)s:%(levelname)s:%(name)s:%(message)s')
+import time
 import traceback
 
-import discord
-import praw
 import prawcore
 
 import database
-import passwords_and_tokens
-
-client = discord.Client()
-
-reddit = praw.Reddit(
-    client_id=passwords_and_tokens.reddit_id,
-    client_secret=passwords_and_tokens.reddit_token,
-    user_agent="Lornebot 0.0.1",
-    check_for_async=False
-)
+import pipeline
+import reddit_api
+from reddit_api import reddit
+from scheduler import MINUTE, WEEK, Scheduler
+from single_flight import SingleFlight
+from transcriptions import is_transcription
 
 tor = reddit.subreddit("TranscribersOfReddit")
 
 with open("ignored_users.txt", "r") as stream:
     ignored_users = [line.strip().casefold() for line in stream]
 
+scheduler = Scheduler()
 
-def is_transcription(comment):
-    created_utc = comment.created_utc
+# Use SingleFlight(lock=database.AdvisoryLock) if several scanners share the database.
+scans = SingleFlight()
 
-    created = datetime.datetime.utcfromtimestamp(created_utc).date()
+# Parts of the request rate for following new comments and for reading histories.
+head_budget = reddit_api.share(0.7, priority=reddit_api.FLAIR)
+backfill_budget = reddit_api.share(0.3)
 
-    if created > datetime.date(2018, 11, 20):
-        body = comment.body
-        return "www.reddit.com/r/TranscribersOfReddit" in body and "&#32;" in body
-    else:
-        # For legacy transcriptions.
-        body = comment.body.casefold()
-        return (
-            "human" in body
-            and "content" in body
-            and "volunteer" in body
-            and "transcriber" in body
-            and "r/TranscribersOfReddit/wiki/index" in body
-        )
+# Users that were just seen transcribing, they are scanned ahead of the schedule.
+urgent_users = asyncio.Queue()
 
+# The queues of the scanner by name, their depths are logged by pipeline.report.
+queues = {"urgent": urgent_users}
 
 batch_one_hundred = (
     "Reddit's API doesn't support fetching more than 100 comments in a single request."
 )
 
 
-async def analyze_user(user, limit=100, from_newest=False, prioritize_new=True):
-    gamma_changed = True
+class UserScan:
+    """
+    The changes to a transcriber found during a round.
+
+    Everything is read from Reddit before anything is written, so the round can be
+    written by apply_scan in one short transaction. The comments that were fetched
+    wait in `comments` until they are classified.
+    """
+
+    def __init__(self, user, transcriber=None):
+        self.user = user
+        self.new_user = transcriber is None
+
+        if transcriber is None:
+            self.start_comment = self.end_comment = self.reference_comment = None
+            self.forwards = False
+            self.valid = None
+            self.official_gamma_count = None
+        else:
+            self.start_comment = transcriber["start_comment"]
+            self.end_comment = transcriber["end_comment"]
+            self.reference_comment = transcriber["reference_comment"]
+            self.forwards = transcriber["forwards"]
+            self.valid = transcriber["valid"]
+            self.official_gamma_count = transcriber["official_gamma_count"]
+
+        self.old_gamma = self.official_gamma_count
+        self.counted_comments = 0
+        self.comments = []
+        self.transcriptions = []
+
+        # Set if the user's comments couldn't be read, they are checked less often.
+        self.failed = False
+
+    @property
+    def gamma_changed(self):
+        return self.official_gamma_count != self.old_gamma
+
+    def update_gamma(self, gamma):
+        """
+        Sets the gamma count read from the reference comment.
+        Returns False only if the gamma count is known to be unchanged.
+        """
+        if gamma is None:
+            # The reference comment lost its flair, a new one has to be found.
+            self.reference_comment = None
+            return True
+
+        if gamma == self.official_gamma_count:
+            logging.info(f"/u/{self.user} has {gamma}Γ. It did not change.")
+            return False
+
+        if self.official_gamma_count is not None:
+            logging.info(
+                f"/u/{self.user} got from {self.official_gamma_count}Γ to {gamma}Γ"
+            )
+        else:
+            logging.info(f"First gamma check for /u/{self.user} they have {gamma}Γ.")
+
+        self.official_gamma_count = gamma
+        return True
+
+    def read(self, comments):
+        """Picks the transcriptions and a reference comment out of the comments."""
+        for comment in comments:
+            if is_transcription(comment):
+                self.transcriptions.append(comment)
+            elif self.reference_comment is None and is_reference_comment(comment):
+                self.reference_comment = comment.id
+                logging.info(f"  Setting reference comment to {comment.id}")
+                # The listing already has the author's current flair.
+                self.update_gamma(gamma_from_flair(comment.author_flair_text))
+
+
+async def analyze_user(
+    user, limit=100, gamma=None, active=False, pages=1, budget=None, handed_off=None
+):
+    """
+    Scans the next comments of a user. If the gamma count was already read from their
+    reference comment it can be passed in so it isn't read again.
+
+    Users that are known to be active have their comments read even if their gamma
+    count didn't change. Up to `pages` listings are read in a row, the requests are
+    taken from `budget` if one is given.
 
+    `handed_off` is an asyncio.Event that is set once the scan was read from Reddit
+    and queued to be written, so a fetcher can move on to the next user.
+
+    Returns whether the user should be scanned again soon, because they had new
+    transcriptions, a new gamma count or still have older comments to read.
+    """
     if limit > 100:
         raise UserWarning(batch_one_hundred)
 
     if user in (None, ""):
         logging.info("A user to be analyzed must be passed.")
-        return
+        return False
 
     if user.casefold() in ignored_users:
         logging.info(f"/u/{user} ignored")
-        return
-
-    redditor = reddit.redditor(user)
+        return False
 
-    new_user = False
-    async with database.get_connection() as connection:
-        redditor_id = None
-        try:
-            redditor_id = getattr(redditor, "id")
-            first_comment = next(redditor.comments.new(limit=1))
-        except BaseException:
-            if redditor_id is None:
-                logging.info(f"/u/{user} is not a valid redditor.")
-                await connection.execute(
-                    """
-                    UPDATE transcribers
-                        SET valid = FALSE
-                    WHERE name = $1;
-                    """,
-                    user,
-                )
-            else:
-                logging.info(f"/u/{user} has no comments, cannot fetch their stats.")
-            return
+    # Callers for a user that is already being scanned share that scan.
+    return await scans.run(
+        user.casefold(),
+        _analyze_user,
+        user,
+        limit,
+        gamma,
+        active,
+        pages,
+        budget,
+        handed_off,
+    )
 
-        logging.info(f"Getting stats for /u/{user}")
 
+async def _analyze_user(user, limit, gamma, active, pages, budget, handed_off=None):
+    async with database.get_connection() as connection:
         transcriber = await connection.fetchrow(
             """SELECT
                     start_comment,
                     end_comment,
                     reference_comment,
                     forwards,
-                    valid
+                    valid,
+                    official_gamma_count
                 FROM transcribers
                 WHERE name = $1;
             """,
             user,
         )
 
-        new_user = transcriber is None
+    # No connection is held while waiting on Reddit.
+    scan = await scan_user(user, transcriber, limit, gamma, active, pages, budget)
+    classify(scan)
 
-        if new_user is True:
-            logging.info(f"  New user: /u/{user}")
-            await connection.execute(
-                """
-                INSERT INTO transcribers (name)
-                VALUES ($1);
-                """,
-                user,
-            )
-            start_comment = end_comment = reference_comment = forwards, valid = None
-        else:
-            start_comment, end_comment, reference_comment, forwards, valid = (
-                transcriber.values()
-            )
+    # The scan is written in a batch with others, it stays in flight until then.
+    written = await writer.put(scan)
+    if handed_off is not None:
+        handed_off.set()
 
-        # If the user has gotten through all of these checks, they're valid.
-        if valid is False or valid is None:
-            await connection.execute(
-                """
-                UPDATE transcribers
-                    SET valid = TRUE
-                WHERE name = $1;
-                """,
-                user,
-            )
+    new_transcriptions = await written
 
-        if reference_comment is not None:
-            gamma_changed = await update_gamma_count(user)
+    if scan.counted_comments > 0:
+        transcriptions = len(scan.transcriptions)
+        s = "s" if transcriptions != 1 else ""
+        new_s = "s" if new_transcriptions != 1 else ""
+        logging.info(
+            f"  Found {transcriptions} total transcription{s}. "
+            f"Added {new_transcriptions} new transcription{new_s}."
+        )
 
-        if first_comment == start_comment:
-            if forwards is True:
-                logging.info(f"  /u/{user} has no unchecked comments")
-                return
-        elif prioritize_new is True and forwards is True:
-            forwards = True
+    logging.info(f"Done checking /u/{user}")
 
-        if start_comment is None or end_comment is None:
-            await connection.execute(
-                """
-                UPDATE transcribers
-                    SET start_comment = $1,
-                    end_comment = $1,
-                    forwards = FALSE
-                WHERE name = $2
-                """,
-                first_comment.id,
-                user,
-            )
-            start_comment = end_comment = first_comment.id
+    return scan.gamma_changed or new_transcriptions > 0 or scan.forwards is False
 
-            # The range is [start_comment, end_comment]; exclusive.
-            # So the first comment has to be checked.
-            if is_transcription(first_comment):
-                return_value = await add_transcription(
-                    user, first_comment, connection=connection
-                )
-            elif is_reference_comment(first_comment):
-                reference_comment = first_comment.id
-                logging.info(f"  Setting reference comment to {reference_comment}")
-                await connection.execute(
-                    """
-                    UPDATE transcribers
-                        SET reference_comment = $1
-                    WHERE name = $2;
-                    """,
-                    reference_comment,
-                    user,
-                )
-                gamma_changed = await update_gamma_count(user)
-
-        params = {}
-        if forwards is True:
-            if start_comment is not None:
-                params = {"before": f"t1_{start_comment}"}
-            else:
-                params = {"after": f"t1_{first_comment}"}
-                forwards = False
+
+async def scan_user(
+    user, transcriber, limit=100, gamma=None, active=False, pages=1, budget=None
+):
+    """
+    Reads the next comments of a user from Reddit without touching the database.
+    """
+    scan = UserScan(user, transcriber)
+    redditor = reddit.redditor(user)
+
+    # Only answers that are about the user count, anything else (5xx, 429, timeouts)
+    # is raised so the scan isn't written.
+    redditor_id = first_comment = None
+    try:
+        redditor_id = await reddit_api.call(getattr, redditor, "id", budget=budget)
+        first_comment = await reddit_api.call(
+            next, redditor.comments.new(limit=1), None, budget=budget
+        )
+    except (prawcore.exceptions.NotFound, prawcore.exceptions.Forbidden):
+        # Deleted and banned accounts.
+        pass
+    except AttributeError:
+        # Suspended accounts have no id.
+        pass
+
+    if first_comment is None:
+        if redditor_id is None:
+            logging.info(f"/u/{user} is not a valid redditor.")
+            scan.valid = False
         else:
-            if end_comment is not None:
-                params = {"after": f"t1_{end_comment}"}
-            else:
-                params = {"after": f"t1_{first_comment}"}
+            logging.info(f"/u/{user} has no comments, cannot fetch their stats.")
 
-        # Passing limit in the signature is overridden by the params argument
-        params.update({"limit": limit, "type": "comments"})
+        scan.failed = True
+        return scan
 
-        comment = start_comment if forwards is True else end_comment
+    logging.info(f"Getting stats for /u/{user}")
 
-        up_to = f"up to {limit} " if limit is not None else ""
-        direction = "forwards" if forwards is True else "backwards"
-        comment_with_id = (
-            f" starting at comment with id: {comment}" if comment is not None else ""
-        )
+    if scan.new_user is True:
+        logging.info(f"  New user: /u/{user}")
 
-        # If the gamma didn't change we don't need to look through all the comments
-        if gamma_changed is False and forwards is True:
-            logging.info(f"  No new transcriptions, setting start_comment to {first_comment.id} and skipping comment check")
-            await connection.execute(
-                """
-                UPDATE transcribers
-                    SET start_comment = $1
-                WHERE name = $2;
-                """,
-                first_comment.id,
-                user,
-            )
-            return
+    # If the user has gotten through all of these checks, they're valid.
+    scan.valid = True
+
+    gamma_changed = True
+    if scan.reference_comment is not None:
+        if gamma is None:
+            gamma = await fetch_gamma(user, scan.reference_comment, budget)
+        gamma_changed = scan.update_gamma(gamma)
+
+    if first_comment.id == scan.start_comment and scan.forwards is True:
+        logging.info(f"  /u/{user} has no unchecked comments")
+        return scan
 
+    if scan.start_comment is None or scan.end_comment is None:
+        scan.start_comment = scan.end_comment = first_comment.id
+        scan.forwards = False
+
+        # The range is [start_comment, end_comment]; exclusive.
+        # So the first comment has to be checked.
+        scan.comments.append(first_comment)
+
+    # If the gamma didn't change we don't need to look through all the comments
+    if gamma_changed is False and scan.forwards is True and active is False:
         logging.info(
-            f"  Fetching {up_to} comments for /u/{user} reading {direction} "
-            f"{comment_with_id}."
+            f"  No new transcriptions, setting start_comment to {first_comment.id} "
+            "and skipping comment check"
         )
+        scan.start_comment = first_comment.id
+        return scan
+
+    if scan.forwards is False:
+        for _ in range(pages):
+            if await read_page(scan, redditor, limit, budget) is False:
+                break
+
+    # Once the history was read, start_comment is moved up to the newest comment.
+    if scan.forwards is True and scan.start_comment != first_comment.id:
+        await read_newest(scan, redditor, limit, budget)
+
+    return scan
+
+
+async def read_newest(scan, redditor, limit=100, budget=None, pages=10):
+    """
+    Reads a user's comments from the newest one back to start_comment and moves
+    start_comment to the newest.
+
+    start_comment falls behind while the gamma of a user doesn't change, reading
+    newest first makes sure the comments that changed it are read. Comments more than
+    `pages` pages back are skipped, like they are while the gamma doesn't change.
+    """
+    user = scan.user
+    params = {"limit": limit, "type": "comments"}
+
+    logging.info(
+        f"  Fetching the newest comments for /u/{user} back to comment with id: "
+        f"{scan.start_comment}."
+    )
+
+    comments = []
+    for _ in range(pages):
         try:
-            comments = list(redditor.comments.new(params=params))
+            page = await reddit_api.call(
+                list, redditor.comments.new(params=dict(params)), budget=budget
+            )
         except prawcore.exceptions.PrawcoreException:
             logging.warn(
                 f"  Exception {traceback.format_exc()}\n Setting /u/{user} to invalid"
             )
-
-            await connection.execute(
-                """
-                UPDATE transcribers
-                    SET valid = FALSE
-                WHERE name = $1;
-                """,
-                user,
-            )
+            scan.valid = False
+            scan.failed = True
+            # start_comment stays, the comments are read again next time.
             return
 
-        comment_count = len(comments)
-
-        end_reached = f"  Reached the end of /u/{user}'s comments."
-        newest_reached = f"  Reached /u/{user}'s newest comment."
-        none_to_read = "  No comments to read."
-        if comment_count == 0:
-            if forwards is True:
-                logging.info(newest_reached)
-                logging.info(none_to_read)
-            else:
-                logging.info(end_reached)
-                logging.info(none_to_read)
-                await connection.execute(
-                    """
-                    UPDATE transcribers
-                        SET forwards = TRUE
-                    WHERE name = $1;
-                    """,
-                    user,
-                )
-            return
+        ids = [comment.id for comment in page]
+        if scan.start_comment in ids:
+            comments.extend(page[: ids.index(scan.start_comment)])
+            break
 
-        logging.info(f"  Reading {comment_count} comments for /u/{user}.")
+        comments.extend(page)
+        if len(page) < limit:
+            break
 
-        transcriptions = 0
-        new_transcriptions = 0
-        for comment in comments:
-            if is_transcription(comment):
-                return_value = await add_transcription(
-                    user, comment, connection=connection
-                )
+        params["after"] = f"t1_{page[-1].id}"
+    else:
+        logging.info(f"  Skipping /u/{user}'s comments older than {comments[-1].id}.")
 
-                transcriptions += 1
-                if return_value != "INSERT 0 0":
-                    new_transcriptions += 1
-            elif (
-                reference_comment is None
-                and comment.subreddit == tor
-                and comment.author_flair_text is not None
-            ):
-                reference_comment = comment.id
-                logging.info(f"  Setting reference comment to {reference_comment}")
-                await connection.execute(
-                    """
-                    UPDATE transcribers
-                        SET reference_comment = $1
-                        WHERE name = $2;
-                    """,
-                    reference_comment,
-                    user,
-                )
-                gamma_changed = await update_gamma_count(user)
+    if len(comments) == 0:
+        logging.info("  No comments to read.")
+        return
 
-        await connection.execute(
-            """
-            UPDATE transcribers
-                SET counted_comments = counted_comments + $1
-            WHERE name = $2;
-            """,
-            comment_count,
-            user,
-        )
+    logging.info(f"  Reading {len(comments)} comments for /u/{user}.")
 
-        s = "s" if transcriptions != 1 else ""
-        new_s = "s" if new_transcriptions != 1 else ""
-        logging.info(
-            f"  Found {transcriptions} total transcription{s}. "
-            f"Added {new_transcriptions} new transcription{new_s}."
-        )
+    scan.comments.extend(comments)
+    scan.counted_comments += len(comments)
+    scan.start_comment = comments[0].id
 
-        first_checked_comment = comments[0].id
-        last_checked_comment = comments[-1].id
+    logging.info(f"  Reached /u/{user}'s newest comment.")
 
-        if comment_count < limit:
-            if forwards is True:
-                logging.info(newest_reached)
-            else:
-                logging.info(end_reached)
-                await connection.execute(
-                    """
-                    UPDATE transcribers
-                        SET forwards = TRUE
-                    WHERE name = $1;
-                    """,
-                    user,
-                )
-            return
 
-        logging.info(
-            f"  Reached comment with id {last_checked_comment} "
-            f"from {first_checked_comment}"
+async def read_page(scan, redditor, limit=100, budget=None):
+    """
+    Reads the next page of a user's history, going backwards from end_comment, into
+    their scan. Returns whether the page was full, so there may be more to read.
+    """
+    user = scan.user
+
+    # Passing limit in the signature is overridden by the params argument
+    params = {"after": f"t1_{scan.end_comment}", "limit": limit, "type": "comments"}
+
+    up_to = f"up to {limit} " if limit is not None else ""
+
+    logging.info(
+        f"  Fetching {up_to}comments for /u/{user} reading backwards "
+        f"starting at comment with id: {scan.end_comment}."
+    )
+    try:
+        comments = await reddit_api.call(
+            list, redditor.comments.new(params=params), budget=budget
         )
+    except prawcore.exceptions.PrawcoreException:
+        logging.warn(
+            f"  Exception {traceback.format_exc()}\n Setting /u/{user} to invalid"
+        )
+        scan.valid = False
+        scan.failed = True
+        return False
+
+    comment_count = len(comments)
 
-        if forwards is True:
+    end_reached = f"  Reached the end of /u/{user}'s comments."
+    if comment_count == 0:
+        logging.info(end_reached)
+        logging.info("  No comments to read.")
+        scan.forwards = True
+        return False
+
+    logging.info(f"  Reading {comment_count} comments for /u/{user}.")
+
+    scan.comments.extend(comments)
+    scan.counted_comments += comment_count
+
+    # Listings are newest first.
+    newest_checked_comment = comments[0].id
+    oldest_checked_comment = comments[-1].id
+
+    scan.end_comment = oldest_checked_comment
+
+    if comment_count < limit:
+        logging.info(end_reached)
+        scan.forwards = True
+        return False
+
+    logging.info(
+        f"  Reached comment with id {oldest_checked_comment} "
+        f"from {newest_checked_comment}"
+    )
+
+    return True
+
+
+async def apply_scan(connection, scan):
+    """
+    Writes a user's round in a single transaction.
+    Returns the number of transcriptions that weren't in the database yet.
+    """
+    async with connection.transaction():
+        if scan.new_user is True:
             await connection.execute(
                 """
-                UPDATE transcribers
-                    SET start_comment = $1
-                WHERE name = $2;
+                INSERT INTO transcribers (name)
+                VALUES ($1)
+                ON CONFLICT DO NOTHING;
                 """,
-                last_checked_comment,
-                user,
+                scan.user,
             )
-        else:
+
+        await connection.execute(
+            """
+            UPDATE transcribers
+                SET valid = $2,
+                start_comment = $3,
+                end_comment = $4,
+                forwards = $5,
+                reference_comment = $6,
+                official_gamma_count = $7,
+                counted_comments = counted_comments + $8,
+                last_scanned = NOW(),
+                failed_checks = CASE WHEN $9 THEN failed_checks + 1 ELSE 0 END,
+                next_check = CASE WHEN $9 THEN NOW() + LEAST(
+                    interval '1 hour' * POWER(2, LEAST(failed_checks, 10)),
+                    interval '30 days'
+                ) END
+            WHERE name = $1;
+            """,
+            scan.user,
+            scan.valid,
+            scan.start_comment,
+            scan.end_comment,
+            scan.forwards,
+            scan.reference_comment,
+            scan.official_gamma_count,
+            scan.counted_comments,
+            scan.failed,
+        )
+
+        new_transcriptions = await add_transcriptions(
+            scan.user, scan.transcriptions, connection=connection
+        )
+
+        if scan.gamma_changed:
             await connection.execute(
                 """
-                UPDATE transcribers
-                    SET end_comment = $1
-                WHERE name = $2;
+                INSERT INTO new_gammas (transcriber, gamma, time)
+                    VALUES ($1, $2, NOW())
+                ON CONFLICT DO NOTHING;
                 """,
-                last_checked_comment,
-                user,
+                scan.user,
+                scan.official_gamma_count,
             )
 
-    logging.info(f"Done checking /u/{user}")
+    return new_transcriptions
 
 
-def is_reference_comment(comment):
-    flair = comment.author_flair_text
-    if comment.subreddit != tor or flair is None:
-        return
+def classify(scan):
+    """Picks the transcriptions and reference comment out of a scan's comments."""
+    scan.read(scan.comments)
+    scan.comments = []
+
+
+async def write_scans(scans):
+    """
+    Writes the rounds of several users in one transaction.
+
+    Each round has its own savepoint, a round that fails doesn't keep the others from
+    being written. Returns the new transcriptions, or the exception, of every round.
+    """
+    results = []
+    async with database.get_connection() as connection:
+        async with connection.transaction():
+            for scan in scans:
+                try:
+                    results.append(await apply_scan(connection, scan))
+                except Exception as exception:
+                    results.append(exception)
+
+    return results
+
 
-    gamma = flair.split(" ")[0]
+# Scans are fetched and classified by the loops below and then written in batches.
+writer = pipeline.BatchStage("write", write_scans, workers=1, maxsize=100, batch=50)
+queues.update(write=writer)
+
+
+def gamma_from_flair(flair):
+    """Reads the gamma count from a ToR flair, returns None if there isn't one."""
+    if flair is None or flair == "":
+        return None
 
     try:
-        int(gamma)
+        return int(flair.split(" ")[0])
     except ValueError:
+        return None
+
+
+def is_reference_comment(comment):
+    if comment.subreddit != tor:
         return False
-    else:
-        return True
 
+    return gamma_from_flair(comment.author_flair_text) is not None
+
+
+async def add_transcriptions(user, comments, connection=None):
+    """Adds the comments as transcriptions in a single statement.
+
+    Returns the number of transcriptions that weren't in the database yet.
+    """
+    if len(comments) == 0:
+        return 0
 
-async def add_transcription(user, comment, connection=None):
     statement = """
         INSERT INTO transcriptions (
                 comment_id,
@@ -375,252 +525,666 @@ async def add_transcription(user, comment, connection=None):
                 subreddit,
                 found,
                 permalink,
-                created
+                created,
+                next_check_at
             )
-            VALUES ($1, $2, $3, $4, NOW(), $5, $6)
-        ON CONFLICT DO NOTHING;
+            SELECT
+                comment_id,
+                $1,
+                content,
+                subreddit,
+                NOW(),
+                permalink,
+                created,
+                -- Old ones found while backfilling are only checked once by charlie.
+                CASE WHEN created > NOW() - interval '2 days' THEN NOW() END
+            FROM UNNEST(
+                $2::text[], $3::text[], $4::text[], $5::text[], $6::timestamptz[]
+            ) AS new (comment_id, content, subreddit, permalink, created)
+        ON CONFLICT DO NOTHING
+        RETURNING comment_id;
     """
     arguments = (
-        comment.id,
         user,
-        comment.body,
-        comment.subreddit.id,
-        comment.permalink,
-        datetime.datetime.fromtimestamp(comment.created),
+        [comment.id for comment in comments],
+        [comment.body for comment in comments],
+        # comment.subreddit.id would send a request, subreddit_id is already loaded.
+        [comment.subreddit_id[3:] for comment in comments],
+        [comment.permalink for comment in comments],
+        [datetime.datetime.fromtimestamp(comment.created) for comment in comments],
     )
     if connection is None:
         async with database.get_connection() as connection:
-            return await connection.execute(statement, *arguments)
+            inserted = await connection.fetch(statement, *arguments)
     else:
-        return await connection.execute(statement, *arguments)
+        inserted = await connection.fetch(statement, *arguments)
 
+    return len(inserted)
 
-async def update_gamma_count(user: str):
-    async with database.get_connection() as connection:
-        reference_comment, old_gamma = await connection.fetchrow(
-            """
-            SELECT
-                reference_comment,
-                official_gamma_count
-            FROM transcribers
-            WHERE name = $1;
-            """,
-            user,
+
+async def fetch_gamma(user, reference_comment, budget=None):
+    """Reads a user's gamma count from the flair on their reference comment."""
+    try:
+        flair = await reddit_api.call(
+            getattr,
+            reddit.comment(reference_comment),
+            "author_flair_text",
+            budget=budget,
         )
+    except Exception:
+        flair = None
 
-        if reference_comment is None:
-            logging.warn(f"Reference comment could not be found for /u/{user}")
-            return True
+    gamma = gamma_from_flair(flair)
+    if gamma is None:
+        logging.warn(f"No flair on /u/{user}'s reference comment: {reference_comment}")
 
-        reference_comment = reddit.comment(reference_comment)
+    return gamma
 
-        no_flair = False
-        no_flair_message = (
-            f"No flair on /u/{user}'s reference comment: {reference_comment}"
-        )
+
+async def check_gammas(transcribers, budget=None):
+    """
+    Reads the gamma counts of transcribers that are caught up with their comments,
+    a hundred reference comments per request.
+
+    Returns the names of the transcribers that need a full scan along with their new
+    gamma count, transcribers whose gamma didn't change are left out.
+    """
+    checked = [
+        transcriber
+        for transcriber in transcribers
+        if transcriber["reference_comment"] is not None
+        and transcriber["forwards"] is True
+    ]
+
+    comments = await reddit_api.info(
+        [f"t1_{transcriber['reference_comment']}" for transcriber in checked], budget
+    )
+    gammas = {
+        comment.id: gamma_from_flair(comment.author_flair_text) for comment in comments
+    }
+
+    to_scan = []
+    for transcriber in transcribers:
+        if transcriber["reference_comment"] is None or transcriber["forwards"] is False:
+            to_scan.append((transcriber["name"], None))
+            continue
+
+        gamma = gammas.get(transcriber["reference_comment"])
+        if gamma != transcriber["official_gamma_count"]:
+            # Without a gamma the full scan looks for a new reference comment.
+            to_scan.append((transcriber["name"], gamma))
+
+    logging.info(
+        f"Checked the gammas of {len(checked)} transcribers in one go, "
+        f"{len(to_scan)} of {len(transcribers)} transcribers need to be scanned."
+    )
+
+    return to_scan
+
+
+async def read_flairs(comments):
+    """
+    Records the gamma counts in the flairs of comments on ToR.
+
+    Commenters with a gamma count who aren't transcribers yet are added, and anyone
+    whose gamma count changed is queued to be scanned right away. stats_bot announces
+    the new gammas when they are inserted.
+    """
+    gammas = {}
+    for comment in comments:
+        # Deleted comments have no author.
+        if comment.author is None:
+            continue
+
+        user = comment.author.name
+        if user.casefold() in ignored_users:
+            continue
+
+        gamma = gamma_from_flair(comment.author_flair_text)
+        if gamma is not None:
+            gammas[user] = gamma
+
+    if len(gammas) == 0:
+        return
+
+    users = list(gammas)
+    async with database.get_connection() as connection:
+        async with connection.transaction():
+            await connection.execute(
+                """
+                INSERT INTO transcribers (name)
+                    SELECT UNNEST($1::text[])
+                ON CONFLICT DO NOTHING;
+                """,
+                users,
+            )
+
+            changes = await connection.fetch(
+                """
+                SELECT
+                    transcribers.name,
+                    official_gamma_count AS old_gamma,
+                    flairs.gamma AS new_gamma
+                FROM UNNEST($1::text[], $2::integer[]) AS flairs (name, gamma)
+                INNER JOIN transcribers ON transcribers.name = flairs.name::citext
+                WHERE official_gamma_count IS DISTINCT FROM flairs.gamma
+                FOR UPDATE OF transcribers;
+                """,
+                users,
+                [gammas[user] for user in users],
+            )
+
+            changed_users = [change["name"] for change in changes]
+            changed_gammas = [change["new_gamma"] for change in changes]
+
+            await connection.execute(
+                """
+                UPDATE transcribers
+                    SET official_gamma_count = flairs.gamma
+                FROM UNNEST($1::text[], $2::integer[]) AS flairs (name, gamma)
+                WHERE transcribers.name = flairs.name::citext;
+                """,
+                changed_users,
+                changed_gammas,
+            )
+
+            await connection.execute(
+                """
+                INSERT INTO new_gammas (transcriber, gamma, time)
+                    SELECT name, gamma, NOW()
+                    FROM UNNEST($1::text[], $2::integer[]) AS flairs (name, gamma)
+                ON CONFLICT DO NOTHING;
+                """,
+                changed_users,
+                changed_gammas,
+            )
+
+    for user, old_gamma, new_gamma in changes:
+        logging.info(f"Flair stream: /u/{user} went from {old_gamma}Γ to {new_gamma}Γ")
+        await urgent_users.put(user)
+
+
+async def flair_stream_loop(delay=10.0):
+    "Follows the newest comments on ToR for flair changes."
+    seen = set()
+    while True:
+        try:
+            comments = await reddit_api.call(
+                list, tor.comments(limit=100), budget=head_budget
+            )
+        except prawcore.exceptions.PrawcoreException:
+            logging.warn(f"Could not read the ToR comments:\n{traceback.format_exc()}")
+            comments = []
+
+        # Oldest first, so the newest flair of a user is read last.
+        new_comments = [
+            comment for comment in reversed(comments) if comment.id not in seen
+        ]
+        if len(comments) > 0:
+            seen = {comment.id for comment in comments}
 
         try:
-            flair = reference_comment.author_flair_text
+            await read_flairs(new_comments)
         except Exception:
-            no_flair = True
-        else:
-            no_flair = flair == "" or flair is None
+            logging.warn(f"Could not read the ToR flairs:\n{traceback.format_exc()}")
+
+        await asyncio.sleep(delay)
+
+
+async def urgent_user_loop():
+    "Scans the users that were seen transcribing."
+    while True:
+        user = await urgent_users.get()
+        try:
+            await analyze_user(user, active=True, budget=head_budget)
+        except Exception:
+            logging.warn(f"Exception while analyzing /u/{user}:\n{traceback.format_exc()}")
+
+        scheduler.reschedule(user, active=True)
+
+
+async def answer_scan_request(request_id, user):
+    """
+    Scans a user that was asked for from Discord and tells stats_bot when done.
+
+    The outcome is sent along: "found" if the user's comments were read, "invalid"
+    for users that aren't valid redditors, "no_comments" and "error".
+    """
+    outcome = None
+    try:
+        # Someone is waiting on this one, it isn't taken from a share of the budget.
+        await analyze_user(user, active=True)
+    except Exception:
+        logging.warn(f"Exception while analyzing /u/{user}:\n{traceback.format_exc()}")
+        outcome = "error"
+
+    scheduler.reschedule(user, active=True)
 
-        if no_flair is True:
-            if reference_comment is not None:
-                await connection.execute(
+    async with database.get_connection() as connection:
+        async with connection.transaction():
+            if outcome is None:
+                transcriber = await connection.fetchrow(
                     """
-                    UPDATE transcribers
-                        SET reference_comment = NULL
+                    SELECT valid, start_comment
+                    FROM transcribers
                     WHERE name = $1;
                     """,
                     user,
                 )
-
-            logging.warn(no_flair_message)
-            return True
-
-        try:
-            official_gamma = int(flair.split(" ")[0])
-        except ValueError:
-            pass
-
-        if old_gamma != official_gamma:
-            if old_gamma is not None:
-                logging.info(f"/u/{user} got from {old_gamma}Γ to {official_gamma}Γ")
-            else:
-                logging.info(
-                    f"First gamma check for /u/{user} they have {official_gamma}Γ."
-                )
+                if transcriber is None or transcriber["valid"] is False:
+                    outcome = "invalid"
+                elif transcriber["start_comment"] is None:
+                    outcome = "no_comments"
+                else:
+                    outcome = "found"
 
             await connection.execute(
                 """
-                INSERT INTO new_gammas (transcriber, gamma, time)
-                    VALUES ($1, $2, NOW());
+                UPDATE scan_requests
+                    SET done = NOW(),
+                    outcome = $2
+                WHERE id = $1;
                 """,
-                user,
-                official_gamma,
+                request_id,
+                outcome,
             )
-
             await connection.execute(
-                """
-                UPDATE transcribers
-                    SET official_gamma_count = $1
-                WHERE name = $2;
-                """,
-                official_gamma,
-                user,
+                "SELECT pg_notify('scan_done', $1);",
+                json.dumps({"id": request_id, "outcome": outcome}),
             )
 
-            await announce_gamma(user, old_gamma, official_gamma)
-            return True
-        elif old_gamma < official_gamma:
-            logging.info(f"Old gamma is less than new gamma for /u/{user}")
-            return True
-        else:
-            logging.info(f"/u/{user} has {official_gamma}Γ. It did not change.")
-            return False
 
+async def scan_request_loop(poll=60.0):
+    """
+    Scans the users that were asked for from Discord ahead of the schedule.
+
+    stats_bot notifies the scan_requests channel when it adds a request. Requests
+    that were missed while nobody was listening are picked up every `poll` seconds.
+    """
+    requested = asyncio.Event()
+    running = set()
+
+    def listener(connection, pid, channel, payload):
+        requested.set()
+
+    async def answer(request_id, user):
+        try:
+            await answer_scan_request(request_id, user)
+        finally:
+            running.discard(request_id)
+
+    async with database.get_connection() as listener_connection:
+        await listener_connection.add_listener("scan_requests", listener)
+
+        while True:
+            requested.clear()
+
+            async with database.get_connection() as connection:
+                requests = await connection.fetch(
+                    """
+                    SELECT id, transcriber
+                    FROM scan_requests
+                    WHERE done IS NULL
+                    ORDER BY id ASC;
+                    """
+                )
+
+            for request_id, user in requests:
+                if request_id not in running:
+                    running.add(request_id)
+                    asyncio.ensure_future(answer(request_id, user))
+
+            try:
+                await asyncio.wait_for(requested.wait(), poll)
+            except asyncio.TimeoutError:
+                pass
 
-async def announce_gamma(user, before, after):
+
+async def load_schedule():
+    "Adds new transcribers to the scheduler and updates everyone's gamma rate."
     async with database.get_connection() as connection:
-        discord_id = await connection.fetchval(
+        transcribers = await connection.fetch(
             """
-            SELECT discord_id
+            SELECT
+                name,
+                COALESCE(
+                    SUM(new_gamma - old_gamma)
+                        FILTER (WHERE time > NOW() - interval '1 week'),
+                    0
+                ) AS weekly_gammas,
+                MAX(time) AS last_active,
+                last_scanned
             FROM transcribers
-            WHERE name = $1;
-            """, user
+            LEFT OUTER JOIN gammas ON name = transcriber
+            GROUP BY name;
+            """
         )
 
-    if discord_id is not None:
-        reference = f"<@{discord_id}>"
-    else:
-        reference = f"/u/{user}"
+    for name, weekly_gammas, last_active, last_scanned in transcribers:
+        if last_active is not None:
+            last_active = last_active.timestamp()
 
-    gammas_channel = 387401723943059460
+        # Picks up where the schedule was before a restart.
+        if last_scanned is not None:
+            last_scanned = last_scanned.timestamp()
 
-    # Bypasses some of the more tedious channel/guild object creation
-    # and also guarantees that it'll work even if not in cache.
-    if before is not None:
-        await client.http.send_message(
-            gammas_channel, f"{reference} got from {before}Γ to {after}Γ"
+        scheduler.add(
+            name,
+            rate=weekly_gammas / WEEK,
+            last_active=last_active,
+            last_scanned=last_scanned,
         )
-    else:
-        await client.http.send_message(
-            gammas_channel, f"{reference} just got found! They have {after}Γ"
-        )
-        return
 
-    if before < 51 <= after:
-        await client.http.send_message(
-            gammas_channel, f"Congrats to {reference} for their green flair!"
-        )
-    elif before < 101 <= after:
-        await client.http.send_message(
-            gammas_channel, f"Teal flair? Not bad, {reference}!"
-        )
-    elif before < 251 <= after:
-        await client.http.send_message(
-            gammas_channel, f"{reference} got purple flair, amazing!"
-        )
-    elif before < 501 <= after:
-        await client.http.send_message(
-            gammas_channel,
-            f"Give it up for the new owner of golden flair, {reference}!",
-        )
-    elif before < 1001 <= after:
-        await client.http.send_message(
-            gammas_channel, f"Holy guacamole, {reference} earned their diamond flair!"
-        )
-    elif before < 2501 <= after:
-        await client.http.send_message(
-            gammas_channel, f"Ruby flair! {reference}, that is absolutely amazing!"
-        )
-    elif before < 5000 <= after:
-        await client.http.send_message(
-            gammas_channel,
-            f"We don't even have a flair name for this yet, {reference}! "
-            "Congratulations for being one of the first.",
+    logging.info(f"Scheduling {len(scheduler)} transcribers")
+
+
+async def mark_scanned(users):
+    """Records that the users were checked, for those whose scan wasn't written."""
+    async with database.get_connection() as connection:
+        await connection.execute(
+            """
+            UPDATE transcribers
+                SET last_scanned = NOW()
+            FROM UNNEST($1::text[]) AS checked (name)
+            WHERE transcribers.name = checked.name::citext;
+            """,
+            users,
         )
 
 
-async def analyze_priority_users(limit=100, from_newest=False, prioritize_new=True, delay=2.5):
+async def scan_loop(workers=4, batch=100, reload=15 * MINUTE):
     """
-    Analyzes the most active users (the users with the most transcriptions in the last week).
+    Scans transcribers as the scheduler makes them due with a pool of workers.
+
+    Due users are taken in batches so their gammas can be checked together, only the
+    ones whose gamma changed are scanned. The workers share the request budget in
+    reddit_api, so adding workers only helps until the budget is used up.
+
+    A worker moves on to the next user as soon as a scan is queued to be written, the
+    user is rescheduled once it was written. The writer's queue holds the workers
+    back when writing falls behind.
     """
-    if limit > 100:
-        raise UserWarning(batch_one_hundred)
+    queue = asyncio.Queue(maxsize=workers)
+    queues["fetch"] = queue
 
-    async with database.get_connection() as connection:
-        # Gets the 25 transcribers with the most transcriptions in the last week
-        transcribers = await connection.fetch(
-            """
-            SELECT transcriber AS name
-            FROM (
-                SELECT transcriber, SUM(new_gamma - old_gamma) AS gamma
-                FROM gammas
-                WHERE time > (NOW() - interval '1 week')
-                GROUP BY transcriber
-                ORDER BY gamma DESC
-                LIMIT 25
-            ) AS accumulated
-            WHERE gamma > 5;
-            """
+    async def scan(user, gamma, handed_off):
+        active = False
+        try:
+            active = await analyze_user(
+                user, gamma=gamma, budget=head_budget, handed_off=handed_off
+            )
+        except Exception:
+            logging.warn(f"Exception while analyzing /u/{user}:\n{traceback.format_exc()}")
+        finally:
+            # Also when the scan failed or was shared with one already running.
+            handed_off.set()
+
+        scheduler.reschedule(user, active)
+
+    async def worker():
+        while True:
+            user, gamma = await queue.get()
+            handed_off = asyncio.Event()
+            asyncio.ensure_future(scan(user, gamma, handed_off))
+            await handed_off.wait()
+
+    def retry_soon(users):
+        # The users were taken off the schedule, they are tried again soon.
+        retry = time.time() + scheduler.min_interval
+        for user in users:
+            scheduler.schedule(user, retry)
+
+    async def dispatcher():
+        loaded = None
+        while True:
+            if loaded is None or time.time() - loaded > reload:
+                try:
+                    await load_schedule()
+                except Exception:
+                    logging.warn(
+                        f"Could not load the schedule:\n{traceback.format_exc()}"
+                    )
+                    await asyncio.sleep(MINUTE)
+                    continue
+
+                loaded = time.time()
+
+            users = await scheduler.due(batch, timeout=reload)
+            if len(users) == 0:
+                continue
+
+            try:
+                async with database.get_connection() as connection:
+                    transcribers = await connection.fetch(
+                        """
+                        SELECT
+                            transcribers.name,
+                            reference_comment,
+                            official_gamma_count,
+                            forwards,
+                            next_check
+                        FROM UNNEST($1::text[]) AS due (name)
+                        INNER JOIN transcribers
+                            ON transcribers.name = due.name::citext;
+                        """,
+                        users,
+                    )
+            except Exception:
+                logging.warn(f"Could not read the due users:\n{traceback.format_exc()}")
+                retry_soon(users)
+                continue
+
+            # Users that were deleted since they were scheduled.
+            found = {transcriber["name"] for transcriber in transcribers}
+            for user in users:
+                if user not in found:
+                    scheduler.forget(user)
+
+            # Users whose comments couldn't be read wait until their next check and
+            # users that are still reading their history are left to backfill_loop.
+            now = time.time()
+            to_check = []
+            for transcriber in transcribers:
+                name = transcriber["name"]
+                next_check = transcriber["next_check"]
+                if next_check is not None and next_check.timestamp() > now:
+                    scheduler.schedule(name, next_check.timestamp())
+                elif transcriber["forwards"] is False:
+                    scheduler.reschedule(name, active=False)
+                else:
+                    to_check.append(transcriber)
+
+            try:
+                to_scan = await check_gammas(to_check, head_budget)
+            except Exception:
+                logging.warn(f"Could not check the gammas:\n{traceback.format_exc()}")
+                retry_soon([transcriber["name"] for transcriber in to_check])
+                continue
+
+            scanned = {user for user, gamma in to_scan}
+            unchanged = [
+                transcriber["name"]
+                for transcriber in to_check
+                if transcriber["name"] not in scanned
+            ]
+            for user in unchanged:
+                scheduler.reschedule(user, active=False)
+
+            # So load_schedule picks up where the schedule was after a restart. They
+            # are already rescheduled, if this fails only a restart is affected.
+            try:
+                await mark_scanned(unchanged)
+            except Exception:
+                logging.warn(
+                    f"Could not record the checked users:\n{traceback.format_exc()}"
+                )
+
+            for user, gamma in to_scan:
+                await queue.put((user, gamma))
+
+    await asyncio.gather(dispatcher(), *(worker() for _ in range(workers)))
+
+
+# The listings read together when backfilling a user, (sort, time filter).
+backfill_listings = [("new", None)] + [
+    (sort, time_filter)
+    for sort in ("top", "controversial")
+    for time_filter in ("all", "year", "month", "week")
+]
+
+
+async def read_listing(redditor, sort, time_filter=None, budget=None, pages=10):
+    """Reads one of a redditor's comment listings a page at a time, newest first."""
+    listing = getattr(redditor.comments, sort)
+    kwargs = {"time_filter": time_filter} if time_filter is not None else {}
+
+    comments = []
+    params = {}
+    # Every listing stops at 1000 comments, so 10 pages.
+    for _ in range(pages):
+        page = await reddit_api.call(
+            list, listing(limit=100, params=dict(params), **kwargs), budget=budget
         )
+        comments.extend(page)
+        if len(page) < 100:
+            break
 
-    for transcriber in transcribers:
-        await analyze_user(transcriber["name"], limit, from_newest, prioritize_new)
-        await asyncio.sleep(delay)
+        params["after"] = f"t1_{page[-1].id}"
 
+    return comments
 
-async def analyze_all_users(limit=100, from_newest=False, prioritize_new=True, delay=2.0):
-    if limit > 100:
-        raise UserWarning(batch_one_hundred)
 
+async def backfill_user(user, pages=5, budget=None):
+    """
+    Reads all listings of a user's comments at once instead of walking backwards
+    through one of them. Each listing reaches back 1000 comments on its own, so
+    together they cover more of a long history.
+
+    Falls back to reading `pages` pages of a normal scan if the newest comments
+    can't be read.
+    """
+    if user.casefold() in ignored_users:
+        logging.info(f"/u/{user} ignored")
+        return False
+
+    return await scans.run(user.casefold(), _backfill_user, user, pages, budget)
+
+
+async def _backfill_user(user, pages, budget):
     async with database.get_connection() as connection:
-        transcribers = await connection.fetch(
-            """
-            SELECT
-                COALESCE(transcriber, name) AS name
-                FROM (
-                    SELECT transcriber
-                    FROM gammas
-                    WHERE time > NOW() - interval '24 hours'
-                    GROUP BY transcriber
-                    ORDER BY SUM(new_gamma - old_gamma) DESC
-                ) top_gammas
-                RIGHT OUTER JOIN transcribers ON name = transcriber
-                ORDER BY transcriber;
-            """
+        transcriber = await connection.fetchrow(
+            """SELECT
+                    start_comment,
+                    end_comment,
+                    reference_comment,
+                    forwards,
+                    valid,
+                    official_gamma_count
+                FROM transcribers
+                WHERE name = $1;
+            """,
+            user,
         )
 
-    for transcriber in transcribers:
-        await analyze_user(transcriber["name"], limit, from_newest, prioritize_new)
-        await asyncio.sleep(delay)
+    redditor = reddit.redditor(user)
+    listings = await asyncio.gather(
+        *(
+            read_listing(redditor, sort, time_filter, budget)
+            for sort, time_filter in backfill_listings
+        ),
+        return_exceptions=True,
+    )
 
+    newest = listings[0]
+    if isinstance(newest, Exception) or len(newest) == 0:
+        return await _analyze_user(user, 100, None, False, pages, budget)
+
+    logging.info(f"Backfilling /u/{user} from {len(backfill_listings)} listings")
+
+    comments = {}
+    for (sort, time_filter), listing in zip(backfill_listings, listings):
+        if isinstance(listing, Exception):
+            logging.warn(f"  Could not read the {sort} comments of /u/{user}")
+            continue
+
+        for comment in listing:
+            comments.setdefault(comment.id, comment)
+
+    scan = UserScan(user, transcriber)
+    scan.valid = True
+
+    # Comments between start_comment and end_comment were counted before, end_comment
+    # may be further back than the listing reaches.
+    ids = [comment.id for comment in newest]
+    counted = 0
+    if scan.start_comment in ids:
+        if scan.end_comment in ids:
+            counted = ids.index(scan.end_comment) + 1
+        else:
+            counted = len(ids)
+        counted -= ids.index(scan.start_comment)
+
+    # The newest comments were read as far back as Reddit allows.
+    scan.start_comment = newest[0].id
+    scan.end_comment = newest[-1].id
+    scan.forwards = True
+    scan.counted_comments = len(newest) - counted
+
+    # Newest first, so the reference comment has the current flair.
+    scan.comments = sorted(
+        comments.values(), key=lambda comment: comment.created_utc, reverse=True
+    )
+
+    classify(scan)
+    new_transcriptions = await writer.submit(scan)
+
+    logging.info(
+        f"Done backfilling /u/{user}: read {len(comments)} comments, "
+        f"added {new_transcriptions} new transcriptions."
+    )
+
+    return True
 
-async def all_user_loop(delay=30):
-    "Loops the analysis of all users."
-    while True:
-        start = datetime.datetime.now()
-        logging.info("--- All User Round Start ---")
-        await analyze_all_users()
-        end = datetime.datetime.now()
-        duration = end - start
-        logging.info(f"--- All User Round End ({duration}) ---")
-        await asyncio.sleep(delay)
 
+async def backfill_loop(workers=1, pages=5, delay=60.0):
+    """
+    Reads the history of users that are still walking backwards through their
+    comments, all of their listings at once.
 
-async def priority_user_loop(delay=30):
-    "Loops the analysis of priority users."
+    Backfilling has its own share of the request budget so new users with a long
+    history can't slow down the scans of everyone else.
+    """
     while True:
-        start = datetime.datetime.now()
-        logging.info("--- Priority User Round Start ---")
-        await analyze_priority_users()
-        end = datetime.datetime.now()
-        duration = end - start
-        logging.info(f"--- Priority User Round End ({duration}) ---")
-        await asyncio.sleep(delay)
+        async with database.get_connection() as connection:
+            transcribers = await connection.fetch(
+                """
+                SELECT name
+                FROM transcribers
+                WHERE forwards = FALSE
+                    AND (next_check IS NULL OR next_check <= NOW())
+                ORDER BY counted_comments ASC;
+                """
+            )
+
+        queue = asyncio.Queue()
+        for transcriber in transcribers:
+            queue.put_nowait(transcriber["name"])
+
+        async def worker():
+            while not queue.empty():
+                user = queue.get_nowait()
+                try:
+                    await backfill_user(user, pages, backfill_budget)
+                except Exception:
+                    logging.warn(
+                        f"Exception while backfilling /u/{user}:\n"
+                        f"{traceback.format_exc()}"
+                    )
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+
+        if len(transcribers) == 0:
+            await asyncio.sleep(delay)
 
 
 async def main():
@@ -629,13 +1193,19 @@ async def main():
     logging.getLogger().setLevel(logging.INFO)
 
     try:
-        await client.login(passwords_and_tokens.discord_token)
         while True:
-            # Execute both loops concurrently.
-            # This should never terminate, as both tasks are infinite loops.
-            await asyncio.gather(all_user_loop(), priority_user_loop())
+            # Execute the loops concurrently.
+            # This should never terminate, as all tasks are infinite loops.
+            await asyncio.gather(
+                scan_loop(),
+                backfill_loop(),
+                flair_stream_loop(),
+                urgent_user_loop(),
+                scan_request_loop(),
+                writer.run(),
+                pipeline.report(queues),
+            )
     finally:
-        await client.close()
         await database.close_pool()
 
 
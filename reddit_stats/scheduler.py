@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import time
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+WEEK = 7 * DAY
+
+
+class Scheduler:
+    """
+    Decides when each transcriber is scanned next.
+
+    Users are kept in a heap ordered by when they are next expected to have something
+    new. Someone who transcribes `rate` times a second is expected about 1 / rate
+    seconds after their last activity. Their interval doubles every time a scan finds
+    nothing and snaps back once a scan finds activity.
+
+    The clock and sleep function can be replaced to drive the scheduler with a
+    simulated clock.
+    """
+
+    def __init__(
+        self,
+        min_interval=5 * MINUTE,
+        max_interval=DAY,
+        backoff=2.0,
+        poll=1.0,
+        clock=time.time,
+        sleep=asyncio.sleep,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.poll = poll
+        self.clock = clock
+        self.sleep = sleep
+
+        # (time, user) entries, an entry is stale if it doesn't match _next_scan.
+        self._heap = []
+        self._next_scan = {}
+        self._intervals = {}
+        self._rates = {}
+        self._last_active = {}
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def __contains__(self, user):
+        return user in self._intervals
+
+    def active_interval(self, user):
+        """How often a user is scanned while they are transcribing."""
+        rate = self._rates.get(user, 0.0)
+        if rate <= 0:
+            return self.min_interval
+
+        return min(max(1 / rate, self.min_interval), self.max_interval)
+
+    def add(self, user, rate=0.0, last_active=None, last_scanned=None):
+        """
+        Adds a user with their gamma rate (per second) and the times they were last
+        active and last scanned. Users that are already known only have their rate
+        updated.
+
+        Nobody is scheduled later than `max_interval` after their last scan, so after
+        a restart the users that waited the longest are scanned first.
+        """
+        if last_active is not None:
+            self._last_active[user] = max(last_active, self._last_active.get(user, 0))
+
+        known = user in self
+        self._rates[user] = rate
+        if known is True:
+            return
+
+        now = self.clock()
+        if rate > 0:
+            self._intervals[user] = self.active_interval(user)
+        else:
+            self._intervals[user] = self.max_interval
+
+        if last_scanned is not None:
+            self._push(user, last_scanned + self._intervals[user])
+        elif last_active is None or rate <= 0:
+            self._push(user, now)
+        else:
+            # Active users are expected an interval after they were last active,
+            # so the ones that are overdue are scanned before everyone else.
+            self._push(user, last_active + self._intervals[user])
+
+    def forget(self, user):
+        self._next_scan.pop(user, None)
+        self._intervals.pop(user, None)
+        self._rates.pop(user, None)
+        self._last_active.pop(user, None)
+
+    def reschedule(self, user, active=False):
+        """Schedules the next scan of a user who was just scanned."""
+        now = self.clock()
+        if active is True:
+            self._last_active[user] = now
+            interval = self.active_interval(user)
+        else:
+            interval = self._intervals.get(user, self.min_interval) * self.backoff
+
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        self._intervals[user] = interval
+        self._push(user, now + interval)
+
+    def schedule(self, user, when):
+        """Schedules the next scan of a user at a fixed time."""
+        if user not in self:
+            self._intervals[user] = self.max_interval
+
+        self._push(user, when)
+
+    def _push(self, user, when):
+        self._next_scan[user] = when
+        heapq.heappush(self._heap, (when, user))
+
+    def pop_due(self, limit=100):
+        """Takes up to `limit` due users off the schedule, the earliest first."""
+        now = self.clock()
+        users = []
+        while self._heap and len(users) < limit and self._heap[0][0] <= now:
+            when, user = heapq.heappop(self._heap)
+            if self._next_scan.get(user) != when:
+                continue
+
+            # Users are off the schedule until they are rescheduled after their scan.
+            del self._next_scan[user]
+            users.append(user)
+
+        return users
+
+    async def due(self, limit=100, timeout=None):
+        """
+        Waits until users are due and returns up to `limit` of them.
+        Returns an empty list if nobody became due before the timeout.
+        """
+        start = self.clock()
+        while True:
+            users = self.pop_due(limit)
+            if len(users) > 0:
+                return users
+
+            if timeout is not None and self.clock() - start >= timeout:
+                return []
+
+            await self.sleep(self.poll)
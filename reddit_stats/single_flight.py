@@ -0,0 +1,44 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers for a key that is already running
+    wait for that call and get its result instead of starting another one.
+
+    `lock` can be a callable returning an async context manager for a key, like
+    database.AdvisoryLock, to also keep other processes from running the same key.
+    Its __aenter__ returns whether the lock was taken, if it wasn't the call is
+    skipped and None is returned.
+    """
+
+    def __init__(self, lock=None):
+        self.lock = lock
+        self._running = {}
+
+    def __contains__(self, key):
+        return key in self._running
+
+    async def run(self, key, function, *args, **kwargs):
+        future = self._running.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._call(key, function, args, kwargs))
+            self._running[key] = future
+            future.add_done_callback(lambda _: self._finish(key, future))
+
+        # A cancelled caller mustn't cancel the call for everyone else.
+        return await asyncio.shield(future)
+
+    async def _call(self, key, function, args, kwargs):
+        if self.lock is None:
+            return await function(*args, **kwargs)
+
+        async with self.lock(key) as locked:
+            if locked is False:
+                return None
+
+            return await function(*args, **kwargs)
+
+    def _finish(self, key, future):
+        if self._running.get(key) is future:
+            del self._running[key]
@@ -0,0 +1,151 @@
+import asyncio
+
+from scheduler import DAY, HOUR, MINUTE, Scheduler
+
+
+class Clock:
+    """A simulated clock, sleeping only moves it forward."""
+
+    def __init__(self, now=1000 * DAY):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_scheduler(**kwargs):
+    clock = Clock()
+    scheduler = Scheduler(clock=clock, sleep=clock.sleep, poll=MINUTE, **kwargs)
+    return scheduler, clock
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def wait_for_due(scheduler, clock):
+    """Runs the clock until someone is due, returns how long that took and who."""
+    start = clock.now
+    users = run(scheduler.due())
+    return clock.now - start, users
+
+
+def test_add_orders_by_when_users_are_expected():
+    scheduler, clock = make_scheduler()
+
+    scheduler.add("new")
+    scheduler.add("active", rate=1 / HOUR, last_active=clock.now - 2 * HOUR)
+    scheduler.add("waited", last_scanned=clock.now - 2 * DAY)
+    scheduler.add("scanned", last_scanned=clock.now)
+
+    assert scheduler.pop_due() == ["waited", "active", "new"]
+    assert wait_for_due(scheduler, clock) == (DAY, ["scanned"])
+
+
+def test_add_only_updates_the_rate_of_known_users():
+    scheduler, clock = make_scheduler()
+
+    scheduler.add("user")
+    scheduler.add("user", rate=1 / HOUR)
+
+    assert len(scheduler) == 1
+    assert scheduler.pop_due() == ["user"]
+    assert scheduler.pop_due() == []
+    assert scheduler.active_interval("user") == HOUR
+
+
+def test_idle_scans_back_off():
+    scheduler, clock = make_scheduler()
+    scheduler.add("user", rate=1 / (10 * MINUTE))
+    scheduler.pop_due()
+
+    waits = []
+    for _ in range(4):
+        scheduler.reschedule("user", active=False)
+        wait, users = wait_for_due(scheduler, clock)
+        assert users == ["user"]
+        waits.append(wait)
+
+    assert waits == [20 * MINUTE, 40 * MINUTE, 80 * MINUTE, 160 * MINUTE]
+
+
+def test_activity_snaps_back_to_the_active_interval():
+    scheduler, clock = make_scheduler()
+    scheduler.add("user", rate=1 / (10 * MINUTE))
+    scheduler.pop_due()
+
+    for _ in range(5):
+        scheduler.reschedule("user", active=False)
+        wait_for_due(scheduler, clock)
+
+    scheduler.reschedule("user", active=True)
+    assert wait_for_due(scheduler, clock) == (10 * MINUTE, ["user"])
+
+    # The backoff starts over from the active interval.
+    scheduler.reschedule("user", active=False)
+    assert wait_for_due(scheduler, clock) == (20 * MINUTE, ["user"])
+
+
+def test_intervals_are_capped_at_max_interval():
+    scheduler, clock = make_scheduler(max_interval=6 * HOUR)
+    scheduler.add("slow", rate=1 / (30 * DAY))
+    scheduler.add("quiet")
+    scheduler.pop_due()
+
+    assert scheduler.active_interval("slow") == 6 * HOUR
+
+    for _ in range(10):
+        scheduler.reschedule("quiet", active=False)
+        assert wait_for_due(scheduler, clock) == (6 * HOUR, ["quiet"])
+
+
+def test_intervals_are_at_least_min_interval():
+    scheduler, clock = make_scheduler()
+    scheduler.add("busy", rate=1 / MINUTE)
+    scheduler.pop_due()
+
+    scheduler.reschedule("busy", active=True)
+    assert wait_for_due(scheduler, clock) == (5 * MINUTE, ["busy"])
+
+
+def test_due_returns_nobody_after_the_timeout():
+    scheduler, clock = make_scheduler()
+    scheduler.add("user", last_scanned=clock.now)
+
+    start = clock.now
+    assert run(scheduler.due(timeout=HOUR)) == []
+    assert clock.now - start == HOUR
+
+
+def test_due_returns_users_that_become_due_before_the_timeout():
+    scheduler, clock = make_scheduler()
+    scheduler.add("user", rate=1 / HOUR, last_active=clock.now)
+
+    start = clock.now
+    assert run(scheduler.due(timeout=2 * HOUR)) == ["user"]
+    assert clock.now - start == HOUR
+
+
+def test_due_takes_up_to_limit_users_earliest_first():
+    scheduler, clock = make_scheduler()
+    for i in range(5):
+        scheduler.add(f"user{i}", last_scanned=clock.now - DAY - i)
+
+    assert run(scheduler.due(limit=3)) == ["user4", "user3", "user2"]
+    assert run(scheduler.due(limit=3)) == ["user1", "user0"]
+
+
+def test_forgotten_users_are_never_due():
+    scheduler, clock = make_scheduler()
+    scheduler.add("user")
+    scheduler.forget("user")
+
+    assert "user" not in scheduler
+    assert run(scheduler.due(timeout=DAY)) == []
@@ -0,0 +1,26 @@
+import datetime
+
+
+def is_transcription(comment):
+    return is_transcription_text(comment.body, comment.created_utc)
+
+
+def is_transcription_text(body, created_utc):
+    """
+    Whether a comment with this body, posted at created_utc, is a transcription.
+    Doesn't need PRAW, so comments read from elsewhere can be checked too.
+    """
+    created = datetime.datetime.utcfromtimestamp(created_utc).date()
+
+    if created > datetime.date(2018, 11, 20):
+        return "www.reddit.com/r/TranscribersOfReddit" in body and "&#32;" in body
+    else:
+        # For legacy transcriptions.
+        body = body.casefold()
+        return (
+            "human" in body
+            and "content" in body
+            and "volunteer" in body
+            and "transcriber" in body
+            and "r/TranscribersOfReddit/wiki/index" in body
+        )
@@ -118,3 +118,138 @@ psql -U postgres -d torstats --command "CREATE TABLE IF NOT EXISTS transcription
         NOT NULL,
     created timestamp with time zone
 );"
+
+# Redditors that couldn't be read are checked again after an exponential backoff.
+psql -U postgres -d torstats --command "ALTER TABLE transcribers
+    ADD COLUMN IF NOT EXISTS failed_checks integer
+        NOT NULL
+        DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS next_check timestamp with time zone;"
+
+# The Reddit allowance shared by every service, there is only ever one row.
+psql -U postgres -d torstats --command "CREATE TABLE IF NOT EXISTS reddit_allowance (
+    id boolean
+        PRIMARY KEY
+        DEFAULT TRUE
+        CHECK (id),
+    remaining integer
+        NOT NULL,
+    reset timestamp with time zone
+        NOT NULL
+);"
+psql -U postgres -d torstats --command "INSERT INTO reddit_allowance (remaining, reset)
+    VALUES (600, NOW())
+    ON CONFLICT DO NOTHING;"
+
+# When each transcriber was last scanned, the schedule is rebuilt from it on restart.
+psql -U postgres -d torstats --command "ALTER TABLE transcribers
+    ADD COLUMN IF NOT EXISTS last_scanned timestamp with time zone;"
+
+# Scans asked for from Discord, reddit_stats is told about them with NOTIFY scan_requests.
+psql -U postgres -d torstats --command "CREATE TABLE IF NOT EXISTS scan_requests (
+    id serial
+        PRIMARY KEY,
+    transcriber citext
+        NOT NULL
+        REFERENCES transcribers(name)
+        ON DELETE CASCADE,
+    requested timestamp with time zone
+        NOT NULL
+        DEFAULT NOW(),
+    done timestamp with time zone
+);"
+
+# New gammas and transcriptions are announced to stats_bot with NOTIFY.
+psql -U postgres -d torstats --command "CREATE OR REPLACE FUNCTION notify_new_gamma ()
+RETURNS trigger
+LANGUAGE plpgsql
+AS \$BODY\$
+BEGIN
+    PERFORM pg_notify('new_gammas', json_build_object(
+        'transcriber', NEW.transcriber,
+        'old_gamma', (
+            SELECT gamma
+            FROM new_gammas
+            WHERE transcriber = NEW.transcriber AND time < NEW.time
+            ORDER BY time DESC
+            LIMIT 1
+        ),
+        'new_gamma', NEW.gamma
+    )::text);
+
+    RETURN NULL;
+END
+\$BODY\$;"
+psql -U postgres -d torstats --command "DROP TRIGGER IF EXISTS new_gamma ON new_gammas;
+CREATE TRIGGER new_gamma AFTER INSERT
+ON new_gammas
+FOR EACH ROW
+EXECUTE PROCEDURE notify_new_gamma();"
+
+# Gammas stats_bot still has to announce, the ones from before the column are skipped.
+psql -U postgres -d torstats --command "ALTER TABLE new_gammas
+    ADD COLUMN IF NOT EXISTS announced boolean
+        NOT NULL
+        DEFAULT TRUE;"
+psql -U postgres -d torstats --command "ALTER TABLE new_gammas
+    ALTER COLUMN announced SET DEFAULT FALSE;"
+psql -U postgres -d torstats --command "CREATE INDEX IF NOT EXISTS new_gammas_unannounced
+    ON new_gammas (transcriber)
+    WHERE announced = FALSE;"
+
+# When charlie last read a transcription's replies, scores are checked more often.
+psql -U postgres -d torstats --command "ALTER TABLE transcriptions
+    ADD COLUMN IF NOT EXISTS replies_checked timestamp with time zone;"
+
+# When charlie checks a transcription next, NULL once it stopped being checked.
+# Transcriptions that are over two days old when they are added start out NULL,
+# charlie checks those once, from the second index.
+psql -U postgres -d torstats --command "ALTER TABLE transcriptions
+    ADD COLUMN IF NOT EXISTS next_check_at timestamp with time zone;"
+psql -U postgres -d torstats --command "ALTER TABLE transcriptions
+    ALTER COLUMN next_check_at SET DEFAULT NOW();"
+psql -U postgres -d torstats --command "UPDATE transcriptions
+    SET next_check_at = NOW()
+    WHERE next_check_at IS NULL
+        AND COALESCE(created, found) > NOW() - interval '2 days'
+        AND error = FALSE;"
+psql -U postgres -d torstats --command "CREATE INDEX IF NOT EXISTS transcriptions_next_check_at
+    ON transcriptions (next_check_at)
+    WHERE next_check_at IS NOT NULL;"
+psql -U postgres -d torstats --command "CREATE INDEX IF NOT EXISTS transcriptions_unchecked
+    ON transcriptions (found)
+    WHERE next_check_at IS NULL AND last_checked IS NULL AND error = FALSE;"
+
+# How many replies to each transcription contain each phrase in charlie/phrases.txt.
+psql -U postgres -d torstats --command "CREATE TABLE IF NOT EXISTS phrase_counts (
+    comment_id text
+        REFERENCES transcriptions(comment_id)
+        ON DELETE CASCADE,
+    phrase text
+        NOT NULL,
+    count integer
+        NOT NULL,
+    PRIMARY KEY (comment_id, phrase)
+);"
+
+# The replies charlie already read and the phrases each of them contains.
+psql -U postgres -d torstats --command "CREATE TABLE IF NOT EXISTS seen_replies (
+    comment_id text
+        REFERENCES transcriptions(comment_id)
+        ON DELETE CASCADE,
+    reply_id text
+        NOT NULL,
+    phrases text[]
+        NOT NULL,
+    PRIMARY KEY (comment_id, reply_id)
+);"
+
+# What a requested scan found, sent to stats_bot along with NOTIFY scan_done.
+psql -U postgres -d torstats --command "ALTER TABLE scan_requests
+    ADD COLUMN IF NOT EXISTS outcome text;"
+
+# Refreshes of a transcription that failed in a row, charlie backs off on them.
+psql -U postgres -d torstats --command "ALTER TABLE transcriptions
+    ADD COLUMN IF NOT EXISTS failed_refreshes integer
+        NOT NULL
+        DEFAULT 0;"
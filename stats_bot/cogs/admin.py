@@ -14,19 +14,11 @@ import traceback
 
 import asyncpg  # noqa: F401
 import discord
-import praw
 from discord.ext import commands
 
-from .. import passwords_and_tokens
+from ..helpers.reddit_api import reddit  # noqa: F401
 from ..utils.permissions import is_owner
 
-reddit = praw.Reddit(
-    client_id=passwords_and_tokens.reddit_id,
-    client_secret=passwords_and_tokens.reddit_token,
-    user_agent="Lornebot 0.0.1",
-    check_for_async=False
-)
-
 
 cogload = time.time()
 
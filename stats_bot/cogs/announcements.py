@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import traceback
+
+from discord.ext import commands
+
+from ..helpers import database_reader
+
+GAMMA_CHANNEL = 387_401_723_943_059_460
+
+# Discord doesn't allow longer messages.
+MESSAGE_LENGTH = 2000
+
+# (gamma, message) in the order the flairs are reached.
+flair_messages = [
+    (51, "Congrats to {reference} for their green flair!"),
+    (101, "Teal flair? Not bad, {reference}!"),
+    (251, "{reference} got purple flair, amazing!"),
+    (501, "Give it up for the new owner of golden flair, {reference}!"),
+    (1001, "Holy guacamole, {reference} earned their diamond flair!"),
+    (2501, "Ruby flair! {reference}, that is absolutely amazing!"),
+    (
+        5000,
+        "We don't even have a flair name for this yet, {reference}! "
+        "Congratulations for being one of the first.",
+    ),
+]
+
+
+def announcement(name, discord_id, old_gamma, new_gamma):
+    if discord_id is not None:
+        reference = f"<@{discord_id}>"
+    else:
+        reference = f"/u/{name}"
+
+    if old_gamma is None:
+        return f"{reference} just got found! They have {new_gamma}Γ"
+
+    lines = [f"{reference} got from {old_gamma}Γ to {new_gamma}Γ"]
+    for gamma, message in flair_messages:
+        if old_gamma < gamma <= new_gamma:
+            lines.append(message.format(reference=reference))
+            break
+
+    return "\n".join(lines)
+
+
+class Announcements(commands.Cog):
+    """
+    Posts new gamma counts in the gammas channel.
+
+    The gammas to announce are kept in the database so none are lost while the bot
+    is down. Everything a user got since their last announcement is merged into one
+    change, and the changes of several users are sent in one message.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.pending = asyncio.Event()
+        self.task = bot.loop.create_task(self.announce_loop())
+
+    def cog_unload(self):
+        self.task.cancel()
+
+    @commands.Cog.listener()
+    async def on_gamma_change(self, name, old_gamma, new_gamma):
+        self.pending.set()
+
+    async def announce_loop(self, poll=60.0):
+        await self.bot.wait_until_ready()
+
+        while True:
+            self.pending.clear()
+            try:
+                announced = await self.announce()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.warn(f"Could not announce gammas:\n{traceback.format_exc()}")
+                announced = 0
+
+            if announced > 0:
+                continue
+
+            # Also looks for gammas every `poll` seconds in case a notification was
+            # missed.
+            try:
+                await asyncio.wait_for(self.pending.wait(), poll)
+            except asyncio.TimeoutError:
+                pass
+
+    async def announce(self, limit=50, delay=1.0):
+        """Sends the pending announcements, returns how many users were announced."""
+        gammas = await database_reader.fetch_unannounced_gammas(limit)
+
+        messages = []
+        content = ""
+        names = []
+        times = []
+        for name, discord_id, old_gamma, new_gamma, last in gammas:
+            lines = announcement(name, discord_id, old_gamma, new_gamma)
+            if content != "" and len(content) + len(lines) + 1 > MESSAGE_LENGTH:
+                messages.append((content, names, times))
+                content = ""
+                names = []
+                times = []
+
+            content = f"{content}\n{lines}" if content != "" else lines
+            names.append(name)
+            times.append(last)
+
+        if content != "":
+            messages.append((content, names, times))
+
+        for content, names, times in messages:
+            # Bypasses some of the more tedious channel/guild object creation
+            # and also guarantees that it'll work even if not in cache.
+            await self.bot.http.send_message(GAMMA_CHANNEL, content)
+            await database_reader.mark_gammas_announced(names, times)
+
+            # Stays below Discord's limit of 5 messages every 5 seconds per channel.
+            await asyncio.sleep(delay)
+
+        return len(gammas)
+
+
+def setup(bot):
+    bot.add_cog(Announcements(bot))
@@ -0,0 +1,66 @@
+import asyncio
+import json
+import logging
+import traceback
+
+from discord.ext import commands
+
+from ..helpers import database_reader
+
+
+class DatabaseEvents(commands.Cog):
+    """
+    Turns the notifications sent by the database triggers into bot events.
+
+    A new gamma dispatches `on_gamma_change(name, old_gamma, new_gamma)` and a
+    requested scan that is done dispatches `on_scan_done(request_id, outcome)`. Any
+    cog can listen to them.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.task = bot.loop.create_task(self.listen())
+
+    def cog_unload(self):
+        self.task.cancel()
+
+    def on_new_gamma(self, connection, pid, channel, payload):
+        gamma = json.loads(payload)
+        self.bot.dispatch(
+            "gamma_change",
+            gamma["transcriber"],
+            gamma["old_gamma"],
+            gamma["new_gamma"],
+        )
+
+    def on_scan_done(self, connection, pid, channel, payload):
+        scan = json.loads(payload)
+        self.bot.dispatch("scan_done", scan["id"], scan["outcome"])
+
+    async def listen(self, keepalive=60.0, retry=10.0):
+        # The pool is created before the bot starts.
+        await self.bot.wait_until_ready()
+
+        while True:
+            try:
+                async with database_reader.get_connection() as connection:
+                    await connection.add_listener("new_gammas", self.on_new_gamma)
+                    await connection.add_listener("scan_done", self.on_scan_done)
+                    logging.info("Listening for database events.")
+
+                    # Notifications only arrive while the connection is alive.
+                    while True:
+                        await asyncio.sleep(keepalive)
+                        await connection.fetchval("SELECT 1;")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.warn(
+                    f"Lost the database events connection:\n{traceback.format_exc()}"
+                )
+
+            await asyncio.sleep(retry)
+
+
+def setup(bot):
+    bot.add_cog(DatabaseEvents(bot))
@@ -3,8 +3,19 @@ import random
 
 from discord.ext import commands
 
+from ..helpers.phrases import PhraseMatcher
+
 insults = None
 
+reactions = {
+    "good bot": "\U0001F916",
+    "bad bot": "\U0001F622",
+    "jarvin": "\U0001F44D",
+    "toria": "\U0001F618",
+}
+
+matcher = PhraseMatcher(list(reactions) + ["send rudes"])
+
 
 def insult():
     if insults is None:
@@ -22,21 +33,14 @@ class ReactionsReactor(commands.Cog):
 
     @commands.Cog.listener()
     async def on_message(self, message):
-        content = message.content.casefold()
-
-        if "good bot" in content:
-            await message.add_reaction("\U0001F916")
-
-        if "bad bot" in content:
-            await message.add_reaction("\U0001F622")
-
-        if "jarvin" in content:
-            await message.add_reaction("\U0001F44D")
+        found = matcher.find(message.content)
 
-        if "toria" in content:
-            await message.add_reaction("\U0001F618")
+        # Reactions are added in the order they are listed.
+        for phrase, emoji in reactions.items():
+            if phrase in found:
+                await message.add_reaction(emoji)
 
-        if "send rudes" in content:
+        if "send rudes" in found:
             await message.channel.send(insult())
 
 
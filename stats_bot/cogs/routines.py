@@ -1,22 +1,14 @@
 import logging
 logging.basicConfig(format='%(asctime)s:%(levelname)s:%(name)s:%(message)s')
 import os
+import traceback
 
 import discord.utils
-import praw
 from discord.ext import commands, tasks
 
-from .. import passwords_and_tokens
 from ..helpers import database_reader, add_user, fetch_transcribers, delete_transcriber, get_redditor_name
 from ..utils.permissions import is_owner
 
-reddit = praw.Reddit(
-    client_id=passwords_and_tokens.reddit_id,
-    client_secret=passwords_and_tokens.reddit_token,
-    user_agent="Lornebot 0.0.1",
-    check_for_async=False
-)
-
 data_directory = os.path.abspath(os.path.join(__file__, os.pardir, os.pardir, "data"))
 leaderboard_path = os.path.join(data_directory, "leaderboard.txt")
 
@@ -74,6 +66,8 @@ class RoutineCog(commands.Cog, command_attrs={"hidden": True}):
 
     def __init__(self, bot):
         self.bot = bot
+        # The leaderboard is only refreshed after a gamma changed.
+        self.leaderboard_stale = True
         self.refresh_leaderboard_loop.start()
 
     def cog_unload(self):
@@ -169,9 +163,23 @@ class RoutineCog(commands.Cog, command_attrs={"hidden": True}):
         logging.info("Purged {} members".format(clean_count));
 
 
+    @commands.Cog.listener()
+    async def on_gamma_change(self, name, old_gamma, new_gamma):
+        self.leaderboard_stale = True
+
     @tasks.loop(seconds=60.0)
     async def refresh_leaderboard_loop(ctx):
-        await refresh_leaderboard_internal(ctx)
+        if ctx.leaderboard_stale is False:
+            return
+
+        # A gamma that changes during the refresh marks it stale again.
+        ctx.leaderboard_stale = False
+        try:
+            await refresh_leaderboard_internal(ctx)
+        except Exception:
+            # Tried again on the next iteration.
+            ctx.leaderboard_stale = True
+            logging.warn(f"Could not refresh the leaderboard:\n{traceback.format_exc()}")
 
     @commands.command()
     async def reset_leaderboard(self, ctx):
@@ -1,13 +1,13 @@
+import asyncio
 import html
 from stats_bot.ranks import try_get_rank_by_name, try_get_rank_by_threshold
 import typing
 
 import discord
-import praw
 from discord.ext import commands
 
-from .. import passwords_and_tokens
-from ..helpers import add_user, database_reader, get_redditor_name
+from ..helpers import add_user, database_reader, get_redditor_name, reddit_api
+from ..helpers.reddit_api import reddit
 from ..utils.converters import Redditor
 from ..utils.paginator import ToRPaginator
 
@@ -15,13 +15,6 @@ no_entries = "No entries were returned for your query."
 
 client_session = None
 
-reddit = praw.Reddit(
-    client_id=passwords_and_tokens.reddit_id,
-    client_secret=passwords_and_tokens.reddit_token,
-    user_agent="Lornebot 0.0.1",
-    check_for_async=False
-)
-
 
 def minutes_to_human_readable(minutes):
     days, hours = divmod(minutes, 60 * 24)
@@ -55,6 +48,32 @@ class TextCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def wait_for_scan(self, request_id, timeout=120.0):
+        """
+        Waits for the scan_done event of a requested scan, sent by the events cog.
+        Returns the outcome of the scan or None if it wasn't done in time.
+        """
+        waiter = self.bot.loop.create_task(
+            self.bot.wait_for(
+                "scan_done",
+                check=lambda done_id, outcome: done_id == request_id,
+                timeout=timeout,
+            )
+        )
+
+        # The scan may have been done before the waiter was listening.
+        outcome = await database_reader.fetch_scan_outcome(request_id)
+        if outcome is not None:
+            waiter.cancel()
+            return outcome
+
+        try:
+            done_id, outcome = await waiter
+        except asyncio.TimeoutError:
+            return None
+
+        return outcome
+
     @commands.command(aliases=["torstats", "transcriptions", "stats"])
     async def tor_stats(self, ctx, redditor: Redditor = None):
         author = get_redditor_name(ctx.message.author.display_name)
@@ -64,11 +83,34 @@ class TextCommands(commands.Cog):
 
         if stats is None or len(stats) != 10:
             if redditor is None or username.casefold() == author.casefold():
-                await ctx.send("I'm working on adding you! The first time you run this command, it takes around an hour for the bot to fetch your data. Check back soon!")
+                message = await ctx.send(
+                    "I'm working on adding you! The first time you run this command, "
+                    "it takes a minute for the bot to fetch your data. "
+                    "I'll update this message when it's there."
+                )
                 await add_user(username, ctx.message.author.id)
+                found = (
+                    "Your first stats are in! Run this command again to see them, "
+                    "I'm still going through your older comments."
+                )
             else:
-                await ctx.send("I don't know that user, sorry!")
+                message = await ctx.send(
+                    "I don't know that user, sorry! I'm looking them up now."
+                )
                 await add_user(username, None)
+                found = f"I found /u/{username}! Run this command again to see them."
+
+            replies = {
+                "found": found,
+                "invalid": f"/u/{username} isn't a valid redditor, sorry!",
+                "no_comments": f"/u/{username} has no comments, so there are no stats.",
+                "error": f"Something went wrong looking up /u/{username}, sorry!",
+            }
+
+            request_id = await database_reader.request_scan(username)
+            outcome = await self.wait_for_scan(request_id)
+            if outcome in replies:
+                await message.edit(content=replies[outcome])
 
             return
 
@@ -143,18 +185,19 @@ class TextCommands(commands.Cog):
 
     async def find(self, source):
         p = reddit.submission(url=source)
+        title = await reddit_api.call(getattr, p, "title")
+        query = p.subreddit.display_name + " | Image | " + title
         tor = reddit.subreddit("TranscribersOfReddit")
         archive = reddit.subreddit("tor_archive")
-        for i in tor.search(
-            p.subreddit.display_name + " | Image | " + p.title, limit=50
-        ):
+
+        # Every request goes through its own call, so each is taken from the budget.
+        for i in await reddit_api.call(list, tor.search(query, limit=50)):
             s = reddit.submission(url=i.url)
             if s.id == p.id:
                 return reddit.submission(url=i.url)
-        for i in archive.search(
-            p.subreddit.display_name + " | Image | " + p.title, limit=50
-        ):
-            s = reddit.submission(url=reddit.submission(url=i.url).url)
+        for i in await reddit_api.call(list, archive.search(query, limit=50)):
+            url = await reddit_api.call(getattr, reddit.submission(url=i.url), "url")
+            s = reddit.submission(url=url)
             if s.id == p.id:
                 return reddit.submission(url=i.url)
         return None
@@ -190,9 +233,11 @@ class TextCommands(commands.Cog):
                     return comment
             return None
 
+        # The comment tree was loaded along with the thread's title, reading it
+        # sends no requests.
         comment = get_done_comment(tor_thread)
         if comment is not None:
-            return comment.get("author")
+            return comment.author
 
     @commands.command()
     async def source(self, ctx, post_url):
@@ -204,14 +249,15 @@ class TextCommands(commands.Cog):
             )
             return
 
-        thread = tor_thread.title.split("|", 2)[2]
+        title = await reddit_api.call(getattr, tor_thread, "title")
+        thread = title.split("|", 2)[2]
 
         embed = discord.Embed(title=thread, url=tor_thread.shortlink)
 
         embed.add_field(name="Flair", value=tor_thread.link_flair_text, inline=True)
 
         if tor_thread.link_flair_text == "Completed!":
-            transcriber = await self.try_find_transcriber(tor_thread)
+            transcriber = await self.find_transcriber(tor_thread)
             if transcriber:
                 embed.add_field(
                     name="Transcriber", value="/u/" + transcriber.name, inline=True
@@ -328,15 +374,8 @@ class TextCommands(commands.Cog):
 
     @commands.command(hidden=False)
     async def permalink(self, ctx, thread: str):
-        await ctx.send(
-            (
-                "This command has been temporarily disabled due to a "
-                "blocking code issue from rate limits."
-            )
-        )
-        return
-
-        await ctx.send("https://reddit.com" + reddit.comment(thread).permalink)
+        permalink = await reddit_api.call(getattr, reddit.comment(thread), "permalink")
+        await ctx.send("https://reddit.com" + permalink)
 
     @permalink.error
     async def permalink_error(self, ctx, error):
@@ -182,25 +182,79 @@ async def fetch_all_stats():
     return all_stats
 
 
-async def get_new_flairs(last_time):
+async def fetch_discord_id(name):
     async with get_connection() as connection:
-        flairs = await connection.fetch(
-            (
-                """
+        discord_id = await connection.fetchval(
+            """
+            SELECT discord_id
+            FROM transcribers
+            WHERE name = $1;
+            """,
+            name,
+        )
+
+    return discord_id
+
+
+async def fetch_unannounced_gammas(limit=50):
+    """
+    Returns the users with gammas that weren't announced yet, the ones that waited
+    the longest first. Every user's gammas are merged into one change.
+    """
+    async with get_connection() as connection:
+        gammas = await connection.fetch(
+            """
+            WITH pending AS (
                 SELECT
-                    transcribers.name,
-                    gammas.old_gamma,
-                    gammas.new_gamma,
-                    transcribers.discord_id
+                    transcriber,
+                    MIN(time) AS first,
+                    MAX(time) AS last
                 FROM new_gammas
-                INNER JOIN transcribers ON name = transcriber
-                WHERE EXTRACT(epoch from time) > $1 ORDER BY TIME;
-                """
-            ),
-            last_time,
+                WHERE announced = FALSE
+                GROUP BY transcriber
+            )
+            SELECT
+                transcribers.name,
+                transcribers.discord_id,
+                (
+                    SELECT gamma
+                    FROM new_gammas
+                    WHERE transcriber = pending.transcriber AND time < pending.first
+                    ORDER BY time DESC
+                    LIMIT 1
+                ) AS old_gamma,
+                (
+                    SELECT MAX(gamma)
+                    FROM new_gammas
+                    WHERE transcriber = pending.transcriber AND time = pending.last
+                ) AS new_gamma,
+                pending.last
+            FROM pending
+            INNER JOIN transcribers ON name = pending.transcriber
+            ORDER BY pending.first ASC
+            LIMIT $1;
+            """,
+            limit,
         )
 
-    return flairs
+    return gammas
+
+
+async def mark_gammas_announced(names, times):
+    """Marks the gammas of each user up to the matching time as announced."""
+    async with get_connection() as connection:
+        await connection.execute(
+            """
+            UPDATE new_gammas
+                SET announced = TRUE
+            FROM UNNEST($1::text[], $2::timestamptz[]) AS sent (name, time)
+            WHERE new_gammas.transcriber = sent.name::citext
+                AND new_gammas.time <= sent.time
+                AND new_gammas.announced = FALSE;
+            """,
+            names,
+            times,
+        )
 
 
 async def add_user(user, discord_id):
@@ -215,6 +269,40 @@ async def add_user(user, discord_id):
             discord_id,
         )
 
+
+async def request_scan(user):
+    """Asks reddit_stats to scan a user right away, returns the id of the request."""
+    async with get_connection() as connection:
+        async with connection.transaction():
+            request_id = await connection.fetchval(
+                """
+                INSERT INTO scan_requests (transcriber)
+                    VALUES ($1)
+                RETURNING id;
+                """,
+                user,
+            )
+            # Sent when the transaction commits.
+            await connection.execute(
+                "SELECT pg_notify('scan_requests', $1);", str(request_id)
+            )
+
+    return request_id
+
+
+async def fetch_scan_outcome(request_id):
+    """Returns the outcome of a requested scan, None if it isn't done yet."""
+    async with get_connection() as connection:
+        return await connection.fetchval(
+            """
+            SELECT outcome
+            FROM scan_requests
+            WHERE id = $1 AND done IS NOT NULL;
+            """,
+            request_id,
+        )
+
+
 async def delete_transcriber(user):
     async with get_connection() as connection:
         await connection.execute(
@@ -19,6 +19,8 @@ startup_extensions = [
     "stats_bot.cogs.reactions",
     "stats_bot.cogs.routines",
     "stats_bot.cogs.handlers",
+    "stats_bot.cogs.events",
+    "stats_bot.cogs.announcements",
 ]
 
 bot = commands.Bot(command_prefix="!", description=description)
@@ -1,18 +1,10 @@
 import datetime
 
-import praw
 import prawcore
 from discord.ext import commands
 
-from .. import passwords_and_tokens
-from ..helpers import get_redditor_name
-
-reddit = praw.Reddit(
-    client_id=passwords_and_tokens.reddit_id,
-    client_secret=passwords_and_tokens.reddit_token,
-    user_agent="Lornebot 0.0.1",
-    check_for_async=False
-)
+from ..helpers import get_redditor_name, reddit_api
+from ..helpers.reddit_api import reddit
 
 
 class Redditor(commands.Converter):
@@ -21,8 +13,11 @@ class Redditor(commands.Converter):
         user = reddit.redditor(name)
 
         try:
-            next(user.comments.new(limit=1))
-        except (StopIteration, prawcore.exceptions.PrawcoreException):
+            comment = await reddit_api.call(next, user.comments.new(limit=1), None)
+        except prawcore.exceptions.PrawcoreException:
+            comment = None
+
+        if comment is None:
             raise commands.BadArgument("Redditor is either invalid or has no comments.")
 
         return user